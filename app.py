@@ -1,27 +1,23 @@
-import os
-import time
 import tkinter as tk
 
-from threading import Thread
+from queue import Empty, Queue
 from tkinter import messagebox
 
-import httpx
-
-from sqlalchemy import create_engine
 from sqlalchemy.exc import ArgumentError as SQLAlchemyArgumentError
 
 from app_components.body import Body
 from app_components.dialogs.key_dialogs import SignatureKeyDialog
-from database.models import Base as BaseDatabaseModel
-from database.operations.fernet_keys import create_fernet_keys
-from server.operations import (
-    check_connection,
-    post_initial_contact_keys,
-    post_pending_exchange_keys,
-    fetch_data,
-)
+from app_components.dispatcher import Dispatcher
+from app_components.messages import MessageWindow
+from database.engine import create_database_engine, create_database_schema
+from server.connection import ConnectionState
+from server.sync_engine import FetchProgress, SyncEngine, SyncResult
+from server.transport import create_client
 from settings import settings
 
+# Interval in milliseconds between checks for synchronisation results.
+_SYNC_RESULTS_INTERVAL = 100
+
 class Application(tk.Tk):
     def __init__(self):
         # Call the Tk constructor and hide the resulting window.
@@ -31,8 +27,8 @@ class Application(tk.Tk):
         self.title(settings.window_name)
         # Attempt to connect to the local database.
         try:
-            self.engine = create_engine(settings.local_database.url)
-            BaseDatabaseModel.metadata.create_all(self.engine)
+            self.engine = create_database_engine(settings.local_database.url)
+            create_database_schema(self.engine)
         # If this fails, show an error message and terminate the application.
         except SQLAlchemyArgumentError:
             messagebox.showerror(
@@ -49,63 +45,83 @@ class Application(tk.Tk):
         else:
             self.destroy()
             return
-        # Create a HTTP client to use in requests.
-        self.http_client = httpx.Client(
-            timeout=settings.server.request_timeout,
-        )
-        # Set up an indicator of server connection.
-        self.connected = check_connection(self.http_client)
+        # Track the server connection from the outcomes of requests, which
+        # are shared by the HTTP client used here and the sync engine.
+        self.connection = ConnectionState()
+        self.http_client = create_client(self.connection)
+        # Set up the passing of callbacks to the main thread.
+        self.dispatcher = Dispatcher(self)
         # Create and place the application body.
         self.body = Body(
             master=self,
             engine=self.engine,
             signature_key=self.signature_key,
             http_client=self.http_client,
-            connected=self.connected,
+            dispatcher=self.dispatcher,
+            connected=self.connection.connected,
         )
         self.body.grid(column=0, row=0, sticky='nsew')
+        # Show changes to the connection as requests succeed or fail.
+        self.connection.subscribe(self._on_connection_change)
         # Configure grid properties.
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
         # Set up the exit protocol.
         self.protocol('WM_DELETE_WINDOW', self._on_close)
-        # Set up repeating calls.
-        self.server_thread = Thread(target=self.operations, daemon=True)
-        self.server_thread.start()
+        # Start synchronising with the server in the background.
+        self.sync_results: Queue[SyncResult | FetchProgress] = Queue()
+        self.sync_engine = SyncEngine(
+            engine=self.engine,
+            signature_key=self.signature_key,
+            results=self.sync_results,
+            connection=self.connection,
+        )
+        self.sync_engine.start()
+        self.after(_SYNC_RESULTS_INTERVAL, self._process_sync_results)
+        # Let the engine poll more often while a message window has focus.
+        self.bind_all('<FocusIn>', self._on_focus_change, add='+')
+        self.bind_all('<FocusOut>', self._on_focus_change, add='+')
         # Restore the window.
         self.deiconify()
 
-    def operations(self):
-        while self.winfo_exists():
-            try:
-                if self.connected:
-                    fetch_data(
-                        self.engine,
-                        self.signature_key,
-                        self.http_client,
-                    )
-                    post_initial_contact_keys(
-                        self.engine,
-                        self.signature_key,
-                        self.http_client,
-                    )
-                    post_pending_exchange_keys(
-                        self.engine,
-                        self.signature_key,
-                        self.http_client,
-                    )
-                else:
-                    self.connected = check_connection(self.http_client)
-            except httpx.NetworkError:
-                self.connected = False
-            create_fernet_keys(self.engine)
-            self.body.set_connection_display(self.connected)
-            time.sleep(settings.server.operations_sleep)
-    
+    def _on_connection_change(self, connected: bool):
+        # Called from the requesting thread, so defer to the main thread.
+        self.dispatcher.call_soon(self.body.set_connection_display, connected)
+
+    def _on_focus_change(self, *_):
+        self.after_idle(self._update_window_focus)
+
+    def _update_window_focus(self):
+        try:
+            widget = self.focus_get()
+        except KeyError:
+            widget = None
+        focused = (
+            widget is not None
+            and isinstance(widget.winfo_toplevel(), MessageWindow)
+        )
+        self.sync_engine.set_window_focused(focused)
+
+    def _process_sync_results(self):
+        try:
+            while True:
+                result = self.sync_results.get_nowait()
+                if isinstance(result, FetchProgress):
+                    self.body.set_fetch_progress(result.stored_elements)
+                    continue
+                self.body.set_fetch_progress(None)
+                if result.error is not None:
+                    self.body.set_sync_error(result.error)
+        except Empty:
+            pass
+        self.after(_SYNC_RESULTS_INTERVAL, self._process_sync_results)
+
     def _on_close(self):
-        path = f'{settings.local_database.url}-journal'
-        if os.path.exists(path):
-            os.remove(path)
+        self.connection.unsubscribe(self._on_connection_change)
+        self.sync_engine.stop()
+        self.dispatcher.stop()
+        # Closing the last connection checkpoints the write-ahead log.
+        self.engine.dispose()
         self.destroy()
 
 
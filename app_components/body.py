@@ -14,6 +14,7 @@ from cryptography.hazmat.primitives.asymmetric.ed25519 import (
 from sqlalchemy import Engine
 
 from app_components.contacts import ContactsPane
+from app_components.dispatcher import Dispatcher
 from settings import settings
 
 class _Notebook(ttk.Notebook):
@@ -23,10 +24,17 @@ class _Notebook(ttk.Notebook):
             engine: Engine,
             signature_key: Ed25519PrivateKey,
             http_client: httpx.Client,
+            dispatcher: Dispatcher,
         ):
         super().__init__(master)
         self.add(
-            child=ContactsPane(self, engine, signature_key, http_client),
+            child=ContactsPane(
+                self,
+                engine,
+                signature_key,
+                http_client,
+                dispatcher,
+            ),
             text='Contacts',
         )
 
@@ -71,6 +79,7 @@ class Body(ttk.Frame):
             engine: Engine,
             signature_key: Ed25519PrivateKey,
             http_client: httpx.Client,
+            dispatcher: Dispatcher,
             connected: bool,
         ):
         # Call the Frame constructor.
@@ -89,12 +98,25 @@ class Body(ttk.Frame):
             pady=settings.graphics.vertical_padding,
         )
         self.set_connection_display(connected)
+        self.fetch_indicator = ttk.Label(
+            master=self,
+            anchor='e',
+            font=settings.get_font(),
+        )
+        self.fetch_indicator.grid(
+            column=1,
+            row=0,
+            sticky='nsew',
+            padx=(0, settings.graphics.horizontal_padding),
+            pady=settings.graphics.vertical_padding,
+        )
 
         _Notebook(
             master=self,
             engine=engine,
             signature_key=signature_key,
             http_client=http_client,
+            dispatcher=dispatcher,
         ).grid(
             column=0,
             row=1,
@@ -124,4 +146,15 @@ class Body(ttk.Frame):
             text = f'Connected to {netloc}.'
         else:
             text = f'Attempting to connect to {netloc}...'
-        self.connection_indicator.config(text=text)
\ No newline at end of file
+        self.connection_indicator.config(text=text)
+
+    def set_fetch_progress(self, stored_elements: int | None):
+        if stored_elements is None:
+            text = ''
+        else:
+            text = f'Receiving data: {stored_elements:,} elements stored...'
+        self.fetch_indicator.config(text=text)
+
+    def set_sync_error(self, error: Exception):
+        text = f'Synchronisation failed ({type(error).__name__}), retrying...'
+        self.fetch_indicator.config(text=text)
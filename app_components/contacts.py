@@ -7,6 +7,7 @@ from sqlalchemy import Engine
 from sqlalchemy.exc import IntegrityError
 
 from app_components.dialogs.contact_dialogs import AddContactDialog
+from app_components.dispatcher import Dispatcher
 from app_components.messages import MessageWindow
 from app_components.scrollable_frames import ScrollableFrame
 from database.operations.contacts import (
@@ -27,19 +28,23 @@ class _ExistingContactsFrame(ScrollableFrame):
             engine: Engine,
             http_client: httpx.Client,
             signature_key: Ed25519PrivateKey,
+            dispatcher: Dispatcher,
         ):
         super().__init__(master)
         self.engine = engine
         self.signature_key = signature_key
         self.http_client = http_client
+        self.dispatcher = dispatcher
         self.message_windows: dict[int, MessageWindow] = {}
         self.interior.columnconfigure(0, weight=1)
 
     def reload(self):
-        for widget in self.interior.winfo_children():
-            widget.grid_forget()
-        for row, contact in enumerate(get_contacts(self.engine)):
-            self._add_row(row, contact)
+        """Request the stored contacts and show them once retrieved."""
+        self.dispatcher.submit(
+            get_contacts,
+            self.engine,
+            on_success=self._show_contacts,
+        )
 
     def _add_row(self, row: int, contact: ContactOutputSchema):
         # Retrieve padding values.
@@ -109,7 +114,7 @@ class _ExistingContactsFrame(ScrollableFrame):
                 master=self.winfo_toplevel(),
                 engine=self.engine,
                 signature_key=self.signature_key,
-                http_client=self.http_client,
+                dispatcher=self.dispatcher,
                 contact=contact,
             )
 
@@ -122,32 +127,47 @@ class _ExistingContactsFrame(ScrollableFrame):
             ),
         )
         if confirmation:
-            remove_contact(self.engine, contact.id)
-            self.reload()
-    
-    def _post_exchange_key(self, contact: ContactOutputSchema):
-        try:
-            post_exchange_key(
-                engine=self.engine,
-                signature_key=self.signature_key,
-                http_client=self.http_client,
-                contact=contact,
+            self.dispatcher.submit(
+                remove_contact,
+                self.engine,
+                contact.id,
+                on_success=lambda _: self.reload(),
             )
-        except httpx.ConnectError:
+
+    def _on_post_error(self, exception: Exception):
+        if isinstance(exception, httpx.TransportError):
             messagebox.showerror(
                 title='Connection Error',
                 message='Post failed: the server could not be reached.',
             )
-        except ClientError as e:
+        elif isinstance(exception, ClientError):
             messagebox.showerror(
                 title='Client Error',
-                message=f'Post failed: {str(e)}.',
+                message=f'Post failed: {str(exception)}.',
             )
-        except ServerError as e:
+        elif isinstance(exception, ServerError):
             messagebox.showerror(
                 title='Server Error',
-                message=f'Post failed: {str(e)}.',
+                message=f'Post failed: {str(exception)}.',
             )
+        else:
+            raise exception
+
+    def _post_exchange_key(self, contact: ContactOutputSchema):
+        self.dispatcher.submit(
+            post_exchange_key,
+            engine=self.engine,
+            signature_key=self.signature_key,
+            http_client=self.http_client,
+            contact=contact,
+            on_error=self._on_post_error,
+        )
+
+    def _show_contacts(self, contacts: list[ContactOutputSchema]):
+        for widget in self.interior.winfo_children():
+            widget.grid_forget()
+        for row, contact in enumerate(contacts):
+            self._add_row(row, contact)
 
 class ContactsPane(ttk.Frame):
     def __init__(
@@ -156,6 +176,7 @@ class ContactsPane(ttk.Frame):
             engine: Engine,
             signature_key: Ed25519PrivateKey,
             http_client: httpx.Client,
+            dispatcher: Dispatcher,
         ):
         # Call the Frame constructor.
         super().__init__(master)
@@ -163,12 +184,14 @@ class ContactsPane(ttk.Frame):
         self.engine = engine
         self.signature_key = signature_key
         self.http_client = http_client
+        self.dispatcher = dispatcher
         # Create and place widgets.
         self.existing_contacts_frame = _ExistingContactsFrame(
             master=self,
             engine=engine,
             signature_key=signature_key,
             http_client=http_client,
+            dispatcher=dispatcher,
         )
         self.existing_contacts_frame.grid(
             column=0,
@@ -207,17 +230,22 @@ class ContactsPane(ttk.Frame):
     def _add_contact(self):
         dialog = AddContactDialog(self)
         self.wait_window(dialog)
-        while dialog.result is not None:
-            contact_input = ContactInputSchema.model_validate(dialog.result)
-            try:
-                add_contact(self.engine, contact_input)
-                break
-            except IntegrityError:
-                messagebox.showerror(
-                    title='Add Contact Error',
-                    message='A contact with this name or key already exists.',
-                )
-            dialog = AddContactDialog(self)
-            self.wait_window(dialog)
-        if dialog.result is not None:
-            self.existing_contacts_frame.reload()
\ No newline at end of file
+        if dialog.result is None:
+            return
+        contact_input = ContactInputSchema.model_validate(dialog.result)
+        self.dispatcher.submit(
+            add_contact,
+            self.engine,
+            contact_input,
+            on_success=lambda _: self.existing_contacts_frame.reload(),
+            on_error=self._on_add_contact_error,
+        )
+
+    def _on_add_contact_error(self, exception: Exception):
+        if not isinstance(exception, IntegrityError):
+            raise exception
+        messagebox.showerror(
+            title='Add Contact Error',
+            message='A contact with this name or key already exists.',
+        )
+        self._add_contact()
\ No newline at end of file
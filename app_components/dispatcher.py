@@ -0,0 +1,81 @@
+import tkinter as tk
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from queue import Empty, SimpleQueue
+from typing import Any, Callable
+
+# Interval in milliseconds between checks for queued callbacks.
+_DISPATCH_INTERVAL = 50
+
+class Dispatcher:
+    """
+    Passes work between the Tk main thread and a background worker.
+
+    Tk may only be used from the thread running its main loop, so callbacks
+    queued from any thread are run there in the order they were queued.
+    Database and network work is submitted to a single worker thread, so
+    that it runs in the order submitted without blocking the main loop.
+    """
+    def __init__(self, master: tk.Tk):
+        self.master = master
+        self.callbacks: SimpleQueue[Callable[[], Any]] = SimpleQueue()
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='dispatcher',
+        )
+        self.master.after(_DISPATCH_INTERVAL, self._dispatch)
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any):
+        """Queue a callback to be run on the main thread."""
+        self.callbacks.put(partial(callback, *args))
+
+    def stop(self):
+        """Stop the worker, discarding any work that has not started."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit[T](
+            self,
+            function: Callable[..., T],
+            *args: Any,
+            on_success: Callable[[T], Any] | None = None,
+            on_error: Callable[[Exception], Any] | None = None,
+            **kwargs: Any,
+        ) -> Future[T]:
+        """
+        Run a function on the worker thread.
+
+        Once it finishes, on_success is called on the main thread with the
+        result, or on_error with the exception raised. Exceptions are
+        otherwise reported through Tk like those raised in callbacks.
+        """
+        future = self.executor.submit(function, *args, **kwargs)
+        def on_done(future: Future[T]):
+            if not future.cancelled():
+                self.call_soon(_resolve, future, on_success, on_error)
+        future.add_done_callback(on_done)
+        return future
+
+    def _dispatch(self):
+        try:
+            while True:
+                # Run each callback as a separate event, so that an error
+                # in one does not hold back the others.
+                self.master.after_idle(self.callbacks.get_nowait())
+        except Empty:
+            pass
+        self.master.after(_DISPATCH_INTERVAL, self._dispatch)
+
+def _resolve[T](
+        future: Future[T],
+        on_success: Callable[[T], Any] | None,
+        on_error: Callable[[Exception], Any] | None,
+    ):
+    exception = future.exception()
+    if exception is None:
+        if on_success is not None:
+            on_success(future.result())
+    elif on_error is not None and isinstance(exception, Exception):
+        on_error(exception)
+    else:
+        raise exception
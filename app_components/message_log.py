@@ -0,0 +1,380 @@
+import tkinter as tk
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from itertools import accumulate
+from math import ceil
+from tkinter import font, ttk
+from typing import Any, Callable
+
+from settings import settings
+
+# Rows drawn beyond each edge of the visible area.
+_BUFFER_ROWS = 10
+# Passes made to settle the layout after newly drawn rows are measured.
+_MAX_LAYOUT_PASSES = 3
+_MIN_TEXT_WIDTH = 100
+_TIMESTAMP_TEMPLATE = '0000-00-00 00:00'
+
+@dataclass
+class LogEntry:
+    author: str
+    text: str
+    timestamp: str
+
+class _RowItems:
+    def __init__(self, canvas: tk.Canvas, bold_font: font.Font):
+        self.author = canvas.create_text(
+            0, 0, anchor='nw', font=bold_font,
+        )
+        self.text = canvas.create_text(
+            0, 0, anchor='nw', font=settings.get_font(),
+        )
+        self.timestamp = canvas.create_text(
+            0, 0, anchor='nw', font=settings.get_font(),
+        )
+
+    def hide(self, canvas: tk.Canvas):
+        for item in (self.author, self.text, self.timestamp):
+            canvas.itemconfigure(item, state='hidden')
+
+    def show(self, canvas: tk.Canvas, entry: LogEntry, text_width: int):
+        canvas.itemconfigure(self.author, text=entry.author, state='normal')
+        canvas.itemconfigure(
+            self.text,
+            text=entry.text,
+            width=text_width,
+            state='normal',
+        )
+        canvas.itemconfigure(
+            self.timestamp,
+            text=entry.timestamp,
+            state='normal',
+        )
+
+class MessageLog(ttk.Frame):
+    """
+    A scrollable log of messages that only draws the rows in view.
+
+    Rows are drawn as canvas text items taken from a pool that is recycled
+    while scrolling, so the number of items depends on the size of the
+    window rather than the length of the conversation. Row heights are
+    estimated until a row is first drawn, when it is measured exactly, and
+    every height is estimated again whenever the wrap width changes.
+
+    If supplied, on_scroll_top is called after rendering while the view is
+    within a screen of the top, so that older entries can be prepended, and
+    on_double_click is called with the index of an entry double-clicked.
+    """
+    def __init__(
+            self,
+            master: tk.Widget | tk.Tk | tk.Toplevel,
+            on_scroll_top: Callable[[], None] | None = None,
+            on_double_click: Callable[[int], None] | None = None,
+        ):
+        super().__init__(master)
+        self.on_scroll_top = on_scroll_top
+        self.on_double_click = on_double_click
+        self.canvas = tk.Canvas(self, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(
+            master=self,
+            orient='vertical',
+            command=self.canvas.yview,
+        )
+        self.canvas.configure(yscrollcommand=self._on_view_change)
+        self.canvas.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        # Store the fonts and the metrics used to lay out rows.
+        self.font = font.Font(self, font=settings.get_font())
+        self.bold_font = font.Font(self, font=settings.get_font_bold())
+        self.line_height = max(
+            self.font.metrics('linespace'),
+            self.bold_font.metrics('linespace'),
+        )
+        sample = 'abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        self.average_char_width = self.font.measure(sample) / len(sample)
+        self.timestamp_width = self.font.measure(_TIMESTAMP_TEMPLATE)
+        self.author_width = 0
+        self.text_width = _MIN_TEXT_WIDTH
+        self.width = 0
+        # Store the entries alongside their heights and row offsets.
+        self.entries: list[LogEntry] = list()
+        self.heights: list[int] = list()
+        self.measured: list[bool] = list()
+        self.offsets: list[int] = [0]
+        # Track drawn rows and the pool of items available for reuse.
+        self.drawn_rows: dict[int, _RowItems] = dict()
+        self.free_rows: list[_RowItems] = list()
+        self.measure_item = self.canvas.create_text(
+            -10_000, -10_000, anchor='nw', font=settings.get_font(),
+        )
+        self.at_bottom = True
+        self.render_pending = False
+        # Bind configure and mousewheel responses.
+        self.canvas.bind('<Configure>', lambda *_: self._schedule_render())
+        self.canvas.bind('<Double-Button-1>', self._on_double_click)
+        def on_mousewheel(event: 'tk.Event[Any]'):
+            y0, y1 = self.canvas.yview()
+            if y1 - y0 >= 1.0:
+                return
+            elif event.delta <= 0:
+                self.canvas.yview_scroll(
+                    settings.functionality.scroll_speed,
+                    'units',
+                )
+            else:
+                self.canvas.yview_scroll(
+                    -settings.functionality.scroll_speed,
+                    'units',
+                )
+        def bind_mousewheel(*_):
+            self.winfo_toplevel().bind('<MouseWheel>', on_mousewheel)
+        def unbind_mousewheel(*_):
+            self.winfo_toplevel().unbind('<MouseWheel>')
+        self.bind('<Enter>', bind_mousewheel)
+        self.bind('<Leave>', unbind_mousewheel)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def delete(self, index: int, count: int):
+        """
+        Remove a number of entries, starting from the given index.
+
+        The view is kept in place as when inserting, unless the row at the
+        top of the view is removed, in which case the following row is
+        moved to the top.
+        """
+        count = min(count, len(self.entries) - index)
+        if count <= 0:
+            return
+        stick_to_bottom, anchor, view_offset = self._get_view()
+        if anchor >= index + count:
+            anchor -= count
+        elif anchor >= index:
+            anchor, view_offset = index, 0
+        del self.entries[index:index + count]
+        del self.heights[index:index + count]
+        del self.measured[index:index + count]
+        drawn_rows: dict[int, _RowItems] = dict()
+        for i, row_items in self.drawn_rows.items():
+            if i < index:
+                drawn_rows[i] = row_items
+            elif i >= index + count:
+                drawn_rows[i - count] = row_items
+            else:
+                row_items.hide(self.canvas)
+                self.free_rows.append(row_items)
+        self.drawn_rows = drawn_rows
+        self._update_layout()
+        self._restore_view(stick_to_bottom, anchor, view_offset)
+        self._schedule_render()
+
+    def extend(self, entries: list[LogEntry]):
+        """Add entries to the end of the log."""
+        self.insert(len(self.entries), entries)
+
+    def insert(self, index: int, entries: list[LogEntry]):
+        """
+        Insert entries before the given index.
+
+        If the view is at the bottom of the log it will remain there, and
+        otherwise the row at the top of the view is kept in place.
+        """
+        if not entries:
+            return
+        stick_to_bottom, anchor, view_offset = self._get_view()
+        if self.entries and index <= anchor:
+            anchor += len(entries)
+        self._update_author_width(entries)
+        self.entries[index:index] = entries
+        self.heights[index:index] = [
+            self._estimate_height(x.text) for x in entries
+        ]
+        self.measured[index:index] = [False] * len(entries)
+        self.drawn_rows = {
+            i + len(entries) if i >= index else i: row_items
+            for i, row_items in self.drawn_rows.items()
+        }
+        self._update_layout()
+        self._restore_view(stick_to_bottom, anchor, view_offset)
+        self._schedule_render()
+
+    def prepend(self, entries: list[LogEntry]):
+        """Add entries to the start of the log."""
+        self.insert(0, entries)
+
+    def _estimate_height(self, text: str) -> int:
+        chars_per_line = max(1, int(self.text_width / self.average_char_width))
+        lines = sum(
+            max(1, ceil(len(x) / chars_per_line))
+            for x in text.split('\n')
+        )
+        return lines * self.line_height
+
+    def _get_view(self) -> tuple[bool, int, float]:
+        """Return the state needed to restore the view after a change."""
+        view_top = self.canvas.canvasy(0)
+        anchor = self._row_at(view_top)
+        return self.at_bottom, anchor, view_top - self._row_top(anchor)
+
+    def _measure(self, index: int) -> bool:
+        """Measure a row exactly, returning whether its height changed."""
+        if self.measured[index]:
+            return False
+        self.measured[index] = True
+        self.canvas.itemconfigure(
+            self.measure_item,
+            text=self.entries[index].text,
+            width=self.text_width,
+        )
+        bbox = self.canvas.bbox(self.measure_item)
+        height = max(bbox[3] - bbox[1], self.line_height)
+        if height == self.heights[index]:
+            return False
+        self.heights[index] = height
+        return True
+
+    def _on_double_click(self, event: 'tk.Event[tk.Canvas]'):
+        if self.on_double_click is None or not self.entries:
+            return
+        y = self.canvas.canvasy(event.y)
+        if y < self._row_top(len(self.entries)):
+            self.on_double_click(self._row_at(y))
+
+    def _on_view_change(self, first: str, last: str):
+        self.scrollbar.set(first, last)
+        self.at_bottom = float(last) >= 1.0
+        self._schedule_render()
+
+    def _render(self):
+        self.render_pending = False
+        width = self.canvas.winfo_width()
+        if width <= 1:
+            return
+        if width != self.width:
+            self._set_width(width)
+        for _ in range(_MAX_LAYOUT_PASSES):
+            first, last = self._visible_rows()
+            changed = [self._measure(i) for i in range(first, last)]
+            if not any(changed):
+                break
+            self._update_layout_in_place()
+        self._draw_rows(*self._visible_rows())
+        view_top = self.canvas.canvasy(0)
+        if self.on_scroll_top and view_top < self.canvas.winfo_height():
+            self.on_scroll_top()
+
+    def _draw_rows(self, first: int, last: int):
+        for index in [x for x in self.drawn_rows if not first <= x < last]:
+            row_items = self.drawn_rows.pop(index)
+            row_items.hide(self.canvas)
+            self.free_rows.append(row_items)
+        padding = settings.graphics.horizontal_padding
+        text_x = 2 * padding + self.author_width
+        timestamp_x = self.width - padding - self.timestamp_width
+        for index in range(first, last):
+            row_items = self.drawn_rows.get(index)
+            if row_items is None:
+                if self.free_rows:
+                    row_items = self.free_rows.pop()
+                else:
+                    row_items = _RowItems(self.canvas, self.bold_font)
+                row_items.show(
+                    self.canvas,
+                    self.entries[index],
+                    self.text_width,
+                )
+                self.drawn_rows[index] = row_items
+            y = self._row_top(index)
+            self.canvas.coords(row_items.author, padding, y)
+            self.canvas.coords(row_items.text, text_x, y)
+            self.canvas.coords(row_items.timestamp, timestamp_x, y)
+
+    def _restore_view(
+            self,
+            stick_to_bottom: bool,
+            anchor: int,
+            view_offset: float,
+        ):
+        if stick_to_bottom:
+            self.canvas.yview_moveto(1.0)
+        else:
+            top = self._row_top(anchor) + view_offset
+            self.canvas.yview_moveto(top / self._scroll_height())
+
+    def _row_at(self, y: float) -> int:
+        """Return the index of the row at a canvas y-coordinate."""
+        y -= settings.graphics.vertical_padding
+        index = bisect_right(self.offsets, y) - 1
+        return min(max(index, 0), max(len(self.entries) - 1, 0))
+
+    def _row_top(self, index: int) -> int:
+        return settings.graphics.vertical_padding + self.offsets[index]
+
+    def _schedule_render(self):
+        if not self.render_pending:
+            self.render_pending = True
+            self.after_idle(self._render)
+
+    def _scroll_height(self) -> int:
+        padding = settings.graphics.vertical_padding
+        gap = padding if self.entries else 0
+        content_height = self.offsets[-1] - gap + 2 * padding
+        return max(content_height, self.canvas.winfo_height())
+
+    def _set_width(self, width: int):
+        self.width = width
+        padding = settings.graphics.horizontal_padding
+        self.text_width = max(
+            width - self.author_width - self.timestamp_width - 4 * padding,
+            _MIN_TEXT_WIDTH,
+        )
+        # Wrapping has changed, so every row must be measured again.
+        self.heights = [self._estimate_height(x.text) for x in self.entries]
+        self.measured = [False] * len(self.entries)
+        for row_items in self.drawn_rows.values():
+            row_items.hide(self.canvas)
+            self.free_rows.append(row_items)
+        self.drawn_rows.clear()
+        self._update_layout_in_place()
+
+    def _update_author_width(self, entries: list[LogEntry]):
+        author_width = max(
+            self.author_width,
+            *(self.bold_font.measure(x.author) for x in entries),
+        )
+        if author_width != self.author_width:
+            self.author_width = author_width
+            # Force the columns to be laid out again on the next render.
+            self.width = 0
+
+    def _update_layout(self):
+        gap = settings.graphics.vertical_padding
+        self.offsets = [0, *accumulate(x + gap for x in self.heights)]
+        self.canvas.configure(
+            scrollregion=(0, 0, self.width, self._scroll_height()),
+        )
+
+    def _update_layout_in_place(self):
+        """Update the layout, keeping the row at the top of the view still."""
+        if not self.entries:
+            self._update_layout()
+            return
+        view = self._get_view()
+        self._update_layout()
+        self._restore_view(*view)
+
+    def _visible_rows(self) -> tuple[int, int]:
+        if not self.entries:
+            return 0, 0
+        view_top = self.canvas.canvasy(0)
+        view_bottom = view_top + self.canvas.winfo_height()
+        first = max(self._row_at(view_top) - _BUFFER_ROWS, 0)
+        last = min(
+            self._row_at(view_bottom) + 1 + _BUFFER_ROWS,
+            len(self.entries),
+        )
+        return first, last
@@ -1,23 +1,34 @@
 import tkinter as tk
 
+from bisect import bisect
 from datetime import datetime
-from threading import Thread
-from tkinter import messagebox, ttk
+from tkinter import messagebox
+from typing import Callable
 from zoneinfo import ZoneInfo
 
-import httpx
-
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
-from sqlalchemy import Engine, select
-from sqlalchemy.orm import Session
-from app_components.scrollable_frames import ScrollableFrame
-from database.models import Message, MessageType
+from sqlalchemy import Engine
+from app_components.dispatcher import Dispatcher
+from app_components.message_log import LogEntry, MessageLog
+from database.models import MessageType, OutboxStatus
+from database.notifications import message_notifier, outbox_notifier
+from database.operations.messages import (
+    fetch_message_page,
+    fetch_new_messages,
+    get_last_message_id,
+)
+from database.operations.outbox import (
+    dismiss_outbox_message,
+    get_outbox_messages,
+    retry_outbox_message,
+)
 from database.schemas.output import (
     ContactOutputSchema,
     MessageOutputSchema,
+    OutboxMessageOutputSchema,
 )
-from server.exceptions import ClientError, ServerError
-from server.operations import check_connection, post_message
+from server.exceptions import MissingFernetKey
+from server.operations import queue_message
 from settings import settings
 
 class MessageWindow(tk.Toplevel):
@@ -26,7 +37,7 @@ class MessageWindow(tk.Toplevel):
             master: tk.Widget | tk.Tk | tk.Toplevel,
             engine: Engine,
             signature_key: Ed25519PrivateKey,
-            http_client: httpx.Client,
+            dispatcher: Dispatcher,
             contact: ContactOutputSchema,
         ):
         # Call the TopLevel constructor.
@@ -37,12 +48,24 @@ class MessageWindow(tk.Toplevel):
         self.engine = engine
         self.signature_key = signature_key
         self.contact = contact
-        self.http_client = http_client
+        self.dispatcher = dispatcher
         # Store metadata on loaded messages.
-        self.loaded_nonces: list[str] = list()
-        self.last_message_timestamp = datetime.min
+        self.message_keys: list[tuple[datetime, int]] = list()
+        self.loaded_ids: set[int] = set()
+        self.last_message_id = 0
+        self.history_loaded = False
+        # Store the ids and statuses of queued messages, shown after the rest.
+        self.outbox_entries: list[tuple[int, OutboxStatus]] = list()
+        # Track database work in progress, which is done by the dispatcher.
+        self.loading_history = False
+        self.updating = True
+        self.update_requested = False
         # Create and place widgets.
-        self.message_log = ScrollableFrame(self)
+        self.message_log = MessageLog(
+            self,
+            on_scroll_top=self._load_older_messages,
+            on_double_click=self._on_entry_double_click,
+        )
         self.message_log.grid(
             column=0,
             row=0,
@@ -69,130 +92,277 @@ class MessageWindow(tk.Toplevel):
         # Configure grid properties.
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
-        self.message_log.interior.columnconfigure(1, weight=1, minsize=100)
-        # Load in existing messages and set up regular updates.
-        self._update_message_log()
+        # Load the latest messages and update whenever new ones are stored
+        # or the queued messages change.
+        self.loading_history = True
+        self.dispatcher.submit(
+            _fetch_latest_messages,
+            engine=self.engine,
+            contact_id=self.contact.id,
+            on_success=self._show_latest_messages,
+            on_error=self._on_latest_messages_error,
+        )
+        message_notifier.subscribe(contact.id, self._on_messages_stored)
+        outbox_notifier.subscribe(contact.id, self._on_messages_stored)
+        self.bind('<Destroy>', self._on_destroy)
         # Finalise and focus on the input box.
         self.input_box.focus()
         self.input_box.bind('<Return>', self._post_message)
         self.input_box.bind('<Shift-Return>', lambda *_: None)
 
-    def _update_message_log(self):
-        query = (
-            select(Message)
-            .where(Message.contact_id == self.contact.id)
-            .where(Message.timestamp >= self.last_message_timestamp)
-            .where(~Message.nonce.in_(self.loaded_nonces))
+    def _create_log_entry(self, message: MessageOutputSchema) -> LogEntry:
+        if message.message_type == MessageType.SENT.value:
+            author = 'You:'
+        else:
+            author = f'{self.contact.name}:'
+        return LogEntry(
+            author=author,
+            text=message.text,
+            timestamp=message.timestamp.astimezone(
+                ZoneInfo('Europe/London'),
+            ).strftime(
+                '%Y-%m-%d %H:%M',
+            ),
         )
-        with Session(self.engine) as session:
-            messages = (
-                MessageOutputSchema.model_validate(message)
-                for message in session.scalars(query)
+
+    def _create_outbox_entry(
+            self,
+            message: OutboxMessageOutputSchema,
+        ) -> LogEntry:
+        if message.status == OutboxStatus.FAILED:
+            status = 'Not sent'
+        else:
+            status = 'Sending...'
+        return LogEntry(author='You:', text=message.text, timestamp=status)
+
+    def _insert_new_messages(self, messages: list[MessageOutputSchema]):
+        # Group new messages by where they belong, as timestamps assigned by
+        # the server may predate messages that are already displayed.
+        insertions: dict[int, list[MessageOutputSchema]] = dict()
+        for message in messages:
+            self.last_message_id = max(self.last_message_id, message.id)
+            key = (message.timestamp, message.id)
+            if message.id in self.loaded_ids:
+                continue
+            elif not self.history_loaded and key < self.message_keys[0]:
+                # The message will be loaded with the older history.
+                continue
+            index = bisect(self.message_keys, key)
+            insertions.setdefault(index, list()).append(message)
+        for index, group in sorted(insertions.items(), reverse=True):
+            self.loaded_ids.update(x.id for x in group)
+            keys = [(x.timestamp, x.id) for x in group]
+            self.message_keys[index:index] = keys
+            self.message_log.insert(
+                index,
+                [self._create_log_entry(x) for x in group],
+            )
+
+    def _load_older_messages(self):
+        """Request the page of messages preceding those already loaded."""
+        if not self.history_loaded and not self.loading_history:
+            self._request_page(on_success=self._prepend_messages)
+
+    def _on_destroy(self, event: 'tk.Event[tk.Misc]'):
+        if event.widget is self:
+            message_notifier.unsubscribe(
+                self.contact.id,
+                self._on_messages_stored,
+            )
+            outbox_notifier.unsubscribe(
+                self.contact.id,
+                self._on_messages_stored,
             )
-            for message in messages:
-                row = len(self.loaded_nonces)
-                if row == 0:
-                    pady = 0
-                else:
-                    pady = (settings.graphics.vertical_padding, 0)
-
-                author_label = ttk.Label(
-                    master=self.message_log.interior,
-                    anchor='nw',
-                    font=settings.get_font_bold(),
-                )
-                if message.message_type == MessageType.SENT.value:
-                    author_label.config(text='You:')
-                else:
-                    author_label.config(text=f'{self.contact.name}:')
-                author_label.grid(column=0, row=row, sticky='nw', pady=pady)
-
-                message_label = ttk.Label(
-                    master=self.message_log.interior,
-                    text=message.text,
-                    font=settings.get_font(),
-                    anchor='nw',
-                )
-                message_label.bind(
-                    sequence='<Configure>',
-                    func=(
-                        lambda _, label=message_label:
-                            label.config(
-                                wraplength=label.winfo_width() - 5,
-                            )
-                    )
-                )
-                message_label.grid(
-                    column=1,
-                    row=len(self.loaded_nonces),
-                    sticky='nsew',
-                    ipadx=settings.graphics.horizontal_padding,
-                    padx=settings.graphics.horizontal_padding,
-                    pady=pady,
-                )
-
-                datetime_label = ttk.Label(
-                    master=self.message_log.interior,
-                    text=message.timestamp.astimezone(
-                        ZoneInfo('Europe/London'),
-                    ).strftime(
-                        '%Y-%m-%d %H:%M',
-                    ),
-                    font=settings.get_font(),
-                    anchor='nw',
-                )
-                datetime_label.grid(column=2, row=row, sticky='nw', pady=pady)
-                self.loaded_nonces.append(hex(message.nonce))
-                self.last_message_timestamp = message.timestamp
-        self.after(
-            ms=int(settings.functionality.message_refresh_interval * 1000),
-            func=self._update_message_log,
+
+    def _on_entry_double_click(self, index: int):
+        """Offer to send a rejected message again, or to delete it."""
+        outbox_index = index - len(self.message_keys)
+        if not 0 <= outbox_index < len(self.outbox_entries):
+            return
+        id, status = self.outbox_entries[outbox_index]
+        if status != OutboxStatus.FAILED:
+            return
+        response = messagebox.askyesnocancel(
+            title='Message Not Sent',
+            message=(
+                'The server rejected this message. Would you like to send '
+                'it again? Choose No to delete it.'
+            ),
         )
-    
+        if response is None:
+            return
+        self.dispatcher.submit(
+            retry_outbox_message if response else dismiss_outbox_message,
+            engine=self.engine,
+            id=id,
+        )
+
+    def _on_history_error(self, exception: Exception):
+        self.loading_history = False
+        raise exception
+
+    def _on_latest_messages_error(self, exception: Exception):
+        """Start updating the log even though its first page failed."""
+        self.loading_history = False
+        # Every message has an id above the last, so updates load them all.
+        self.history_loaded = True
+        self.updating = False
+        if self.winfo_exists():
+            self._poll_message_log()
+        raise exception
+
+    def _on_messages_stored(self):
+        # Called from the storing thread, so defer to the main thread.
+        self.dispatcher.call_soon(self._refresh_message_log)
+
+    def _on_post_error(self, plaintext: str, exception: Exception):
+        """Report a failed send and restore the message to the input box."""
+        if isinstance(exception, MissingFernetKey):
+            messagebox.showerror(
+                title='Missing Key',
+                message=f'Send failed: {str(exception)}.',
+            )
+        else:
+            raise exception
+        if self.winfo_exists():
+            self.input_box.insert('1.0', plaintext)
+            self.input_box.focus()
+
+    def _on_update_error(self, exception: Exception):
+        self.updating = False
+        raise exception
+
+    def _poll_message_log(self):
+        """Update the log, then repeat as a safety net if configured to."""
+        self._update_message_log()
+        interval = settings.functionality.message_refresh_interval
+        if interval is not None:
+            self.after(ms=int(interval * 1000), func=self._poll_message_log)
+
     def _post_message(self, *_):
         """
-        Post a message to the contact.
+        Send a message to the contact.
 
-        If the input box contains text, then encrypt it using a Fernet key,
-        assemble and send a post request, then store the message using the
-        response timestamp and nonce.
+        If the input box contains text, then encrypt it using a Fernet key
+        and queue it in the outbox, from which the sync engine posts it.
         """
         # Retrieve the message text and ensure it isn't empty.
         plaintext = self.input_box.get('1.0', tk.END).rstrip()
         if not plaintext:
             self.input_box.delete('1.0', tk.END)
             return 'break'
-        try:
-            if not check_connection(self.http_client):
-                raise httpx.ConnectError('')
-            post_thread = Thread(
-                target=post_message,
-                daemon=True,
-                kwargs={
-                    'engine': self.engine,
-                    'signature_key': self.signature_key,
-                    'http_client': self.http_client,
-                    'plaintext': plaintext,
-                    'contact': self.contact,
-                },
-            )
-            post_thread.start()
-            self.input_box.delete('1.0', tk.END)
-        except httpx.ConnectError:
-            messagebox.showerror(
-                title='Connection Error',
-                message='Post failed: the server could not be reached.',
-            )
-        except ClientError as e:
-            messagebox.showerror(
-                title='Client Error',
-                message=f'Post failed: {str(e)}.',
+        self.input_box.delete('1.0', tk.END)
+        self.dispatcher.submit(
+            queue_message,
+            engine=self.engine,
+            signature_key=self.signature_key,
+            plaintext=plaintext,
+            contact=self.contact,
+            on_error=lambda e: self._on_post_error(plaintext, e),
+        )
+        return 'break'
+
+    def _prepend_messages(self, messages: list[MessageOutputSchema]):
+        self.loading_history = False
+        if len(messages) < settings.functionality.message_page_size:
+            self.history_loaded = True
+        if not messages or not self.winfo_exists():
+            return
+        self.loaded_ids.update(x.id for x in messages)
+        self.message_keys[:0] = [(x.timestamp, x.id) for x in messages]
+        self.message_log.prepend([self._create_log_entry(x) for x in messages])
+
+    def _refresh_message_log(self):
+        if self.winfo_exists():
+            self._update_message_log()
+
+    def _request_page(
+            self,
+            on_success: Callable[[list[MessageOutputSchema]], None],
+        ):
+        self.loading_history = True
+        self.dispatcher.submit(
+            fetch_message_page,
+            engine=self.engine,
+            contact_id=self.contact.id,
+            limit=settings.functionality.message_page_size,
+            before=self.message_keys[0] if self.message_keys else None,
+            on_success=on_success,
+            on_error=self._on_history_error,
+        )
+
+    def _show_latest_messages(
+            self,
+            latest: tuple[int, list[MessageOutputSchema]],
+        ):
+        self.last_message_id, messages = latest
+        self._prepend_messages(messages)
+        self.updating = False
+        if self.winfo_exists():
+            self._poll_message_log()
+
+    def _show_updates(
+            self,
+            updates: tuple[
+                list[OutboxMessageOutputSchema],
+                list[MessageOutputSchema],
+            ],
+        ):
+        self.updating = False
+        if not self.winfo_exists():
+            return
+        outbox_messages, messages = updates
+        outbox_entries = [(x.id, x.status) for x in outbox_messages]
+        if outbox_entries != self.outbox_entries:
+            self.message_log.delete(
+                len(self.message_keys),
+                len(self.outbox_entries),
             )
-        except ServerError as e:
-            messagebox.showerror(
-                title='Server Error',
-                message=f'Post failed: {str(e)}.',
+            self.outbox_entries = outbox_entries
+            self.message_log.extend(
+                [self._create_outbox_entry(x) for x in outbox_messages],
             )
-        finally:
-            self.input_box.focus()
-        return 'break'
\ No newline at end of file
+        self._insert_new_messages(messages)
+        if self.update_requested:
+            self.update_requested = False
+            self._update_message_log()
+
+    def _update_message_log(self):
+        """Request messages stored since the log was last updated."""
+        if self.updating:
+            self.update_requested = True
+            return
+        self.updating = True
+        self.dispatcher.submit(
+            _fetch_updates,
+            engine=self.engine,
+            contact_id=self.contact.id,
+            last_message_id=self.last_message_id,
+            on_success=self._show_updates,
+            on_error=self._on_update_error,
+        )
+
+def _fetch_latest_messages(
+        engine: Engine,
+        contact_id: int,
+    ) -> tuple[int, list[MessageOutputSchema]]:
+    # Read the last id first, so that any message stored later has a greater
+    # id, even in an empty conversation.
+    last_message_id = get_last_message_id(engine)
+    messages = fetch_message_page(
+        engine,
+        contact_id,
+        settings.functionality.message_page_size,
+    )
+    return max([last_message_id, *(x.id for x in messages)]), messages
+
+def _fetch_updates(
+        engine: Engine,
+        contact_id: int,
+        last_message_id: int,
+    ) -> tuple[list[OutboxMessageOutputSchema], list[MessageOutputSchema]]:
+    # Read the outbox first, so that a message delivered in between is
+    # shown twice until the next update rather than not at all.
+    outbox_messages = get_outbox_messages(engine, contact_id)
+    messages = fetch_new_messages(engine, contact_id, last_message_id)
+    return outbox_messages, messages
@@ -0,0 +1,98 @@
+"""
+Measure the time taken to decode fetch responses.
+
+Each response holds signed messages and exchange keys from a handful of
+senders, as a server returns them. Responses are decoded both from parsed
+JSON, as before, and directly from the response body. The time taken to
+check every element's signature is reported separately, as this is only
+needed for elements that have not already been stored.
+
+Run from the repository root with:
+
+    python -m benchmarks.fetch_response_decoding
+"""
+import json
+import os
+import time
+
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from server.schemas.responses import FetchDataResponse
+from server.verification import verify_signatures
+
+ELEMENT_COUNTS = (1_000, 10_000)
+KEY_FRACTION = 0.1
+REPEATS = 5
+SENDERS = 8
+
+def _b64(value: bytes) -> str:
+    return urlsafe_b64encode(value).decode()
+
+def _create_body(n: int) -> bytes:
+    senders = [Ed25519PrivateKey.generate() for _ in range(SENDERS)]
+    timestamp = datetime.now(timezone.utc).isoformat()
+    n_keys = int(n * KEY_FRACTION)
+    exchange_keys: list[dict[str, Any]] = list()
+    for i in range(n_keys):
+        sender = senders[i % SENDERS]
+        key = X25519PrivateKey.generate().public_key().public_bytes_raw()
+        exchange_keys.append({
+            'sender_public_key': _b64(sender.public_key().public_bytes_raw()),
+            'transmitted_exchange_key': _b64(key),
+            'signature': _b64(sender.sign(key)),
+            'timestamp': timestamp,
+        })
+    messages: list[dict[str, Any]] = list()
+    for i in range(n - n_keys):
+        sender = senders[i % SENDERS]
+        text = _b64(os.urandom(96))
+        messages.append({
+            'sender_public_key': _b64(sender.public_key().public_bytes_raw()),
+            'encrypted_text': text,
+            'signature': _b64(sender.sign(text.encode())),
+            'timestamp': timestamp,
+            'nonce': os.urandom(16).hex(),
+        })
+    return json.dumps({
+        'status': 'success',
+        'message': 'Data retrieved.',
+        'data': {'exchange_keys': exchange_keys, 'messages': messages},
+    }).encode()
+
+def _time(function: Callable[[], Any]) -> float:
+    timings = list()
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def _verify(body: bytes):
+    response = FetchDataResponse.model_validate_json(body)
+    verify_signatures(response.data.exchange_keys)
+    verify_signatures(response.data.messages)
+
+def main():
+    columns = ('from dict', 'from bytes', '+ verify')
+    print(f'{"elements":>10}' + ''.join(f'{x:>14}' for x in columns))
+    for n in ELEMENT_COUNTS:
+        body = _create_body(n)
+        from_dict = _time(
+            lambda: FetchDataResponse.model_validate(json.loads(body)),
+        )
+        from_bytes = _time(lambda: FetchDataResponse.model_validate_json(body))
+        verified = _time(lambda: _verify(body))
+        print(
+            f'{n:>10,}'
+            f'{from_dict * 1000:>11.1f} ms'
+            f'{from_bytes * 1000:>11.1f} ms'
+            f'{verified * 1000:>11.1f} ms'
+        )
+
+if __name__ == '__main__':
+    main()
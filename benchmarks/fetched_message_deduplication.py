@@ -0,0 +1,137 @@
+"""
+Measure the latency of storing a fetched batch of messages.
+
+Each batch is stored against a database that already holds a large message
+history. Batches are measured both when every message is already stored,
+which is the common case of a repeated fetch, and when every message is
+new. The legacy approach of issuing one query per nonce is timed alongside
+for comparison.
+
+Run from the repository root with:
+
+    python -m benchmarks.fetched_message_deduplication
+"""
+import os
+import tempfile
+import time
+
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import Engine, create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from database.models import Base, Contact, FernetKey, Message, MessageType
+from database.operations.messages import add_fetched_messages
+from server.schemas.responses import FetchedMessage
+
+BATCH_SIZES = (1_000, 10_000, 100_000)
+STORED_MESSAGES = 100_000
+
+def _create_database(
+        path: str,
+        sender_key: Ed25519PrivateKey,
+        fernet_key: bytes,
+        nonces: list[int],
+    ) -> Engine:
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    timestamp = datetime.now(timezone.utc)
+    public_key = sender_key.public_key().public_bytes_raw()
+    with Session(engine) as session:
+        contact = Contact(
+            name='Sender',
+            public_key=urlsafe_b64encode(public_key).decode(),
+        )
+        session.add(contact)
+        session.flush()
+        session.add(FernetKey(
+            key=fernet_key.decode(),
+            timestamp=timestamp,
+            contact_id=contact.id,
+        ))
+        session.execute(insert(Message), [
+            {
+                'text': 'Stored message',
+                'timestamp': timestamp,
+                'message_type': MessageType.RECEIVED,
+                'nonce': hex(nonce),
+                'contact_id': contact.id,
+            }
+            for nonce in nonces
+        ])
+        session.commit()
+    return engine
+
+def _create_batch(
+        sender_key: Ed25519PrivateKey,
+        fernet_key: bytes,
+        nonces: list[int],
+    ) -> list[FetchedMessage]:
+    fernet = Fernet(fernet_key)
+    public_key = sender_key.public_key().public_bytes_raw()
+    sender_public_key = urlsafe_b64encode(public_key).decode()
+    timestamp = datetime.now(timezone.utc).isoformat()
+    batch: list[FetchedMessage] = list()
+    for nonce in nonces:
+        ciphertext = fernet.encrypt(b'Fetched message')
+        batch.append(FetchedMessage.model_validate({
+            'sender_public_key': sender_public_key,
+            'signature': urlsafe_b64encode(sender_key.sign(ciphertext)),
+            'timestamp': timestamp,
+            'encrypted_text': ciphertext.decode(),
+            'nonce': f'{nonce:032x}',
+        }))
+    return batch
+
+def _random_nonces(n: int) -> list[int]:
+    return [int.from_bytes(os.urandom(16)) for _ in range(n)]
+
+def _time_per_nonce_queries(engine: Engine, batch: list[FetchedMessage]):
+    start = time.perf_counter()
+    with Session(engine) as session:
+        for msg in batch:
+            query = select(Message).where(Message.nonce == hex(msg.nonce))
+            session.scalar(query)
+    return time.perf_counter() - start
+
+def _time_add_fetched_messages(engine: Engine, batch: list[FetchedMessage]):
+    start = time.perf_counter()
+    add_fetched_messages(engine, batch)
+    return time.perf_counter() - start
+
+def main():
+    sender_key = Ed25519PrivateKey.generate()
+    fernet_key = Fernet.generate_key()
+    stored_nonces = _random_nonces(STORED_MESSAGES)
+    print(f'Database pre-populated with {STORED_MESSAGES:,} messages.')
+    print(
+        f'{"batch":>8} {"case":>10} '
+        f'{"per-nonce dedupe (s)":>21} {"add_fetched_messages (s)":>25}'
+    )
+    for batch_size in BATCH_SIZES:
+        cases = {
+            'duplicate': stored_nonces[:batch_size],
+            'new': _random_nonces(batch_size),
+        }
+        for case, nonces in cases.items():
+            batch = _create_batch(sender_key, fernet_key, nonces)
+            with tempfile.TemporaryDirectory() as directory:
+                engine = _create_database(
+                    os.path.join(directory, 'benchmark.db'),
+                    sender_key,
+                    fernet_key,
+                    stored_nonces,
+                )
+                legacy_time = _time_per_nonce_queries(engine, batch)
+                bulk_time = _time_add_fetched_messages(engine, batch)
+                engine.dispose()
+            print(
+                f'{batch_size:>8,} {case:>10} '
+                f'{legacy_time:>21.3f} {bulk_time:>25.3f}'
+            )
+
+if __name__ == '__main__':
+    main()
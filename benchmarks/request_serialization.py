@@ -0,0 +1,152 @@
+"""
+Measure the CPU time taken to build and serialise outgoing requests.
+
+Requests are built as before, from key objects that are encoded for every
+request and a signature decoded from its stored Base64, then serialised
+through a dictionary. They are also built as now, from the encodings cached
+by the signer's identity and read from the database, then serialised
+directly to bytes. Times are reported per request, and per message for
+messages posted in batches.
+
+Run from the repository root with:
+
+    python -m benchmarks.request_serialization
+"""
+import json
+import os
+import time
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timezone
+from typing import Any, Callable
+from uuid import uuid4
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+    Ed25519PrivateKey,
+    Ed25519PublicKey,
+)
+from pydantic import BaseModel
+
+from server.identity import get_identity
+from server.schemas.requests import (
+    FetchDataRequest,
+    PostMessageBatchRequestModel,
+    PostMessageRequestModel,
+)
+
+BATCH_SIZE = 100
+CONTACTS = 50
+REPEATS = 5
+REQUESTS = 2_000
+
+def _b64(value: bytes) -> str:
+    return urlsafe_b64encode(value).decode()
+
+def _create_messages(
+        signature_key: Ed25519PrivateKey,
+    ) -> list[dict[str, str]]:
+    # Values as stored in the outbox and contact tables.
+    contacts = [
+        _b64(Ed25519PrivateKey.generate().public_key().public_bytes_raw())
+        for _ in range(CONTACTS)
+    ]
+    messages: list[dict[str, str]] = list()
+    for i in range(REQUESTS):
+        text = _b64(os.urandom(96))
+        messages.append({
+            'contact_key': contacts[i % CONTACTS],
+            'encrypted_text': text,
+            'signature': _b64(signature_key.sign(text.encode())),
+            'idempotency_key': str(uuid4()),
+        })
+    return messages
+
+def _new_message_request(
+        signature_key: Ed25519PrivateKey,
+        message: dict[str, str],
+    ) -> PostMessageRequestModel:
+    return PostMessageRequestModel.model_validate({
+        'public_key': get_identity(signature_key).encoded_public_key,
+        'recipient_public_key': message['contact_key'],
+        'encrypted_text': message['encrypted_text'],
+        'signature': message['signature'],
+        'idempotency_key': message['idempotency_key'],
+    })
+
+def _new_serialise(request: BaseModel) -> bytes:
+    return request.model_dump_json().encode()
+
+def _old_message_request(
+        signature_key: Ed25519PrivateKey,
+        message: dict[str, str],
+    ) -> PostMessageRequestModel:
+    # Output schemas decoded these values when messages were loaded.
+    contact_key = Ed25519PublicKey.from_public_bytes(
+        urlsafe_b64decode(message['contact_key']),
+    )
+    return PostMessageRequestModel.model_validate({
+        'public_key': signature_key.public_key(),
+        'recipient_public_key': contact_key,
+        'encrypted_text': message['encrypted_text'],
+        'signature': urlsafe_b64decode(message['signature']),
+        'idempotency_key': message['idempotency_key'],
+    })
+
+def _old_serialise(request: BaseModel) -> bytes:
+    return json.dumps(request.model_dump(), separators=(',', ':')).encode()
+
+def _time(function: Callable[[], Any]) -> float:
+    timings = list()
+    for _ in range(REPEATS):
+        start = time.process_time()
+        function()
+        timings.append(time.process_time() - start)
+    return min(timings)
+
+def main():
+    signature_key = Ed25519PrivateKey.generate()
+    messages = _create_messages(signature_key)
+    contact_keys = list({x['contact_key'] for x in messages})
+    timestamp = datetime.now(timezone.utc)
+
+    def build_fetch(old: bool):
+        public_key = (
+            signature_key.public_key() if old
+            else get_identity(signature_key).encoded_public_key
+        )
+        return FetchDataRequest.model_validate({
+            'public_key': public_key,
+            'sender_keys': contact_keys,
+            'min_datetime': timestamp,
+            'limit': 500,
+        })
+
+    def run(old: bool, kind: str):
+        build = _old_message_request if old else _new_message_request
+        serialise = _old_serialise if old else _new_serialise
+        if kind == 'message':
+            for message in messages:
+                serialise(build(signature_key, message))
+        elif kind == 'batch':
+            for i in range(0, REQUESTS, BATCH_SIZE):
+                serialise(PostMessageBatchRequestModel(messages=[
+                    build(signature_key, x)
+                    for x in messages[i:i + BATCH_SIZE]
+                ]))
+        else:
+            for _ in messages:
+                serialise(build_fetch(old))
+
+    print(f'{"request":>10}{"before":>14}{"after":>14}{"speed-up":>10}')
+    for kind in ('message', 'batch', 'fetch'):
+        before = _time(lambda: run(True, kind)) / REQUESTS
+        after = _time(lambda: run(False, kind)) / REQUESTS
+        print(
+            f'{kind:>10}'
+            f'{before * 1e6:>11.1f} us'
+            f'{after * 1e6:>11.1f} us'
+            f'{before / after:>9.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
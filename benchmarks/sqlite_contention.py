@@ -0,0 +1,136 @@
+"""
+Measure contention between a writer thread and message window readers.
+
+A writer thread commits batches of messages, as the sync engine does, while
+several reader threads repeatedly select a page of message rows, as open
+message windows do. Each run uses a fresh database, first with SQLAlchemy's default
+connection settings and then with the configured SQLite profile. Reads
+taking longer than LOCK_WAIT_THRESHOLD are counted as having waited on a
+lock held by the writer.
+
+Run from the repository root with:
+
+    python -m benchmarks.sqlite_contention
+"""
+import os
+import statistics
+import tempfile
+import time
+
+from datetime import datetime, timezone
+from threading import Event, Thread
+from typing import Callable
+
+from sqlalchemy import Engine, create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database.engine import create_database_engine
+from database.models import Base, Contact, Message, MessageType
+
+BATCH_SIZE = 500
+DURATION = 5.0
+LOCK_WAIT_THRESHOLD = 0.01
+READ_INTERVAL = 0.005
+READERS = 4
+STORED_MESSAGES = 20_000
+
+def _populate(engine: Engine):
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Contact(name='Contact', public_key='A' * 43 + '='))
+        session.commit()
+    _insert_messages(engine, STORED_MESSAGES)
+
+def _insert_messages(engine: Engine, n: int):
+    timestamp = datetime.now(timezone.utc)
+    with Session(engine) as session:
+        session.execute(insert(Message), [
+            {
+                'text': 'Benchmark message',
+                'timestamp': timestamp,
+                'message_type': MessageType.RECEIVED,
+                'nonce': os.urandom(16).hex(),
+                'contact_id': 1,
+            }
+            for _ in range(n)
+        ])
+        session.commit()
+
+def _read(engine: Engine, stop: Event, latencies: list[float], errors: list):
+    # Select raw rows so that the timings are dominated by locking.
+    query = (
+        select(Message.id, Message.text, Message.timestamp)
+        .where(Message.contact_id == 1)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(100)
+    )
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                session.execute(query).all()
+        except OperationalError as e:
+            errors.append(e)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(READ_INTERVAL)
+
+def _write(engine: Engine, stop: Event, commits: list[int], errors: list):
+    while not stop.is_set():
+        try:
+            _insert_messages(engine, BATCH_SIZE)
+            commits[0] += 1
+        except OperationalError as e:
+            errors.append(e)
+
+def _run(create: Callable[[str], Engine], path: str) -> dict[str, float]:
+    engine = create(f'sqlite:///{path}')
+    _populate(engine)
+    stop = Event()
+    commits = [0]
+    latencies: list[float] = list()
+    errors: list[OperationalError] = list()
+    threads = [Thread(target=_write, args=(engine, stop, commits, errors))]
+    threads.extend(
+        Thread(target=_read, args=(engine, stop, latencies, errors))
+        for _ in range(READERS)
+    )
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    latencies.sort()
+    return {
+        'commits/s': commits[0] / DURATION,
+        'reads/s': len(latencies) / DURATION,
+        'p50 (ms)': statistics.median(latencies) * 1000,
+        'p99 (ms)': latencies[int(len(latencies) * 0.99)] * 1000,
+        'max (ms)': latencies[-1] * 1000,
+        'lock waits': sum(x > LOCK_WAIT_THRESHOLD for x in latencies),
+        'errors': len(errors),
+    }
+
+def main():
+    profiles = {
+        'default': create_engine,
+        'configured': create_database_engine,
+    }
+    print(
+        f'{READERS} readers and 1 writer for {DURATION:.0f} s, '
+        f'{STORED_MESSAGES:,} messages pre-populated.'
+    )
+    results = dict()
+    for name, create in profiles.items():
+        with tempfile.TemporaryDirectory() as directory:
+            results[name] = _run(create, os.path.join(directory, 'bench.db'))
+    print(f'{"":>12}' + ''.join(f'{name:>12}' for name in profiles))
+    for metric in results['default']:
+        print(f'{metric:>12}' + ''.join(
+            f'{results[name][metric]:>12.1f}' for name in profiles
+        ))
+
+if __name__ == '__main__':
+    main()
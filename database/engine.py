@@ -0,0 +1,52 @@
+from sqlite3 import Connection as SQLiteConnection
+from typing import Any
+
+from sqlalchemy import Engine, create_engine, event
+
+from database.models import Base
+from settings import settings
+
+def create_database_engine(url: str) -> Engine:
+    """
+    Create an engine for the local database.
+
+    SQLite connections are configured with the pragmas in the SQLite
+    settings as they are opened. Write-ahead logging lets the sync engine
+    commit while message windows read, rather than locking them out.
+    """
+    engine = create_engine(url)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _configure_sqlite_connection)
+    return engine
+
+def create_database_schema(engine: Engine):
+    """
+    Create any tables and indexes missing from the local database.
+
+    create_all skips tables that already exist, so indexes added to a table
+    since an existing database was created are checked for separately.
+    """
+    Base.metadata.create_all(engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def _configure_sqlite_connection(connection: SQLiteConnection, _: Any):
+    sqlite_settings = settings.local_database.sqlite
+    busy_timeout = int(sqlite_settings.busy_timeout * 1000)
+    foreign_keys = 'ON' if sqlite_settings.foreign_keys else 'OFF'
+    pragmas = (
+        f'busy_timeout = {busy_timeout}',
+        f'journal_mode = {sqlite_settings.journal_mode}',
+        f'synchronous = {sqlite_settings.synchronous}',
+        f'mmap_size = {sqlite_settings.mmap_size}',
+        # A negative cache size is interpreted as a number of kibibytes.
+        f'cache_size = -{sqlite_settings.cache_size_kib}',
+        f'foreign_keys = {foreign_keys}',
+    )
+    cursor = connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(f'PRAGMA {pragma}')
+    finally:
+        cursor.close()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import binascii
+
+from base64 import urlsafe_b64decode
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Iterable
+
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database.models import FernetKey
+from schema_components.validators import datetime_to_utc
+
+# Allowance for a sender's clock running ahead of the server's clock.
+_CLOCK_SKEW = timedelta(minutes=5)
+_TOKEN_VERSION = 0x80
+
+class FernetKeyRing:
+    """
+    The Fernet keys shared with a contact, ordered by creation time.
+
+    Decryption first tries the key that was newest when the token was
+    created, according to the timestamp embedded in the token, and only
+    falls back to trying every other key when that fails.
+    """
+    def __init__(self, keys: list[tuple[datetime, Fernet]]):
+        keys = sorted(keys, key=lambda x: x[0])
+        self._timestamps = [x[0].timestamp() for x in keys]
+        self._keys = [x[1] for x in keys]
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def latest(self) -> Fernet | None:
+        return self._keys[-1] if self._keys else None
+
+    def decrypt(self, token: str | bytes) -> bytes | None:
+        index = self._route(token)
+        if index is not None:
+            try:
+                return self._keys[index].decrypt(token)
+            except InvalidToken:
+                pass
+        for i in reversed(range(len(self._keys))):
+            if i == index:
+                continue
+            try:
+                return self._keys[i].decrypt(token)
+            except InvalidToken:
+                continue
+        return None
+
+    def _route(self, token: str | bytes) -> int | None:
+        token_timestamp = _get_token_timestamp(token)
+        if token_timestamp is None or not self._keys:
+            return None
+        limit = token_timestamp + _CLOCK_SKEW.total_seconds()
+        return max(bisect_right(self._timestamps, limit) - 1, 0)
+
+# Key rings are shared by every session in the process, keyed by contact.
+_key_rings: dict[int, FernetKeyRing] = dict()
+_key_rings_generation = 0
+_key_rings_lock = Lock()
+
+def get_key_ring(session: Session, contact_id: int) -> FernetKeyRing:
+    """Retrieve the cached key ring for a contact, loading it if needed."""
+    with _key_rings_lock:
+        key_ring = _key_rings.get(contact_id)
+        generation = _key_rings_generation
+    if key_ring is not None:
+        return key_ring
+    query = (
+        select(FernetKey.timestamp, FernetKey.key)
+        .where(FernetKey.contact_id == contact_id)
+    )
+    key_ring = FernetKeyRing([
+        (datetime_to_utc(timestamp), Fernet(key))
+        for timestamp, key in session.execute(query)
+    ])
+    with _key_rings_lock:
+        # Skip caching if the key set changed while the ring was loading.
+        if generation == _key_rings_generation:
+            _key_rings[contact_id] = key_ring
+    return key_ring
+
+def invalidate_key_rings(contact_ids: Iterable[int]):
+    """Discard cached key rings after the stored key set changes."""
+    global _key_rings_generation
+    with _key_rings_lock:
+        for contact_id in contact_ids:
+            _key_rings.pop(contact_id, None)
+        _key_rings_generation += 1
+
+def _get_token_timestamp(token: str | bytes) -> int | None:
+    try:
+        data = urlsafe_b64decode(token)
+    except (binascii.Error, ValueError):
+        return None
+    if len(data) < 9 or data[0] != _TOKEN_VERSION:
+        return None
+    return int.from_bytes(data[1:9], 'big')
\ No newline at end of file
@@ -3,7 +3,7 @@ from enum import Enum
 
 from sqlalchemy import Enum as SQLEnum, ForeignKey, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy.types import DateTime, String, Text
+from sqlalchemy.types import DateTime, Integer, String, Text
 
 def _values_callable(x: type[Enum]):
     return [i.value for i in x]
@@ -44,6 +44,10 @@ class Contact(Base):
         back_populates='contact',
         cascade='all, delete-orphan',
     )
+    outbox_messages: Mapped[list['OutboxMessage']] = relationship(
+        back_populates='contact',
+        cascade='all, delete-orphan',
+    )
 
 class MessageType(Enum):
     SENT = 'S'
@@ -80,6 +84,57 @@ class Message(Base):
     )
     contact: Mapped[Contact] = relationship()
 
+class OutboxStatus(Enum):
+    PENDING = 'P'
+    FAILED = 'F'
+
+class OutboxMessage(Base):
+    __tablename__ = 'outbox_messages'
+
+    id: Mapped[int] = mapped_column(
+        primary_key=True,
+    )
+    text: Mapped[str] = mapped_column(
+        Text(),
+        nullable=False,
+    )
+    encrypted_text: Mapped[str] = mapped_column(
+        Text(),
+        nullable=False,
+    )
+    signature: Mapped[str] = mapped_column(
+        String(88),
+        nullable=False,
+    )
+    idempotency_key: Mapped[str] = mapped_column(
+        String(32),
+        nullable=False,
+        unique=True,
+    )
+    status: Mapped[OutboxStatus] = mapped_column(
+        SQLEnum(OutboxStatus, values_callable=_values_callable),
+        nullable=False,
+        default=OutboxStatus.PENDING,
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer(),
+        nullable=False,
+        default=0,
+    )
+    next_attempt: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+        default=None,
+    )
+    contact_id: Mapped[int] = mapped_column(
+        ForeignKey(
+            column=Contact.id,
+        ),
+    )
+    contact: Mapped[Contact] = relationship(
+        back_populates='outbox_messages',
+    )
+
 class KeyType(Enum):
     EPHEMERAL = 'E'
     COMPLETE = 'C'
@@ -110,6 +165,10 @@ class FernetKey(Base):
 
 class SentKey(Base):
     __tablename__ = 'sent_keys'
+    __table_args__ = (
+        Index('sent_keys_contact_index', 'contact_id'),
+    )
+
     id: Mapped[int] = mapped_column(
         primary_key=True,
     )
@@ -178,4 +237,19 @@ class ReceivedKey(Base):
     fernet_key: Mapped[FernetKey | None] = relationship(
         back_populates='received_key',
         single_parent=True,
+    )
+
+class SyncCursor(Base):
+    __tablename__ = 'sync_cursors'
+    id: Mapped[int] = mapped_column(
+        primary_key=True,
+    )
+    public_key: Mapped[str] = mapped_column(
+        String(44),
+        nullable=False,
+        unique=True,
+    )
+    timestamp: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
     )
\ No newline at end of file
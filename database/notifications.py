@@ -0,0 +1,50 @@
+from threading import Lock
+from typing import Callable, Iterable
+
+type MessageListener = Callable[[], None]
+
+class MessageNotifier:
+    """
+    Notifies listeners when messages are stored for a contact.
+
+    Listeners are called from the thread that stored the messages, so
+    listeners belonging to the UI must hand work to the Tk main thread.
+    Listeners subscribed with a contact id of None are called once for each
+    publication, whichever contacts it concerns.
+    """
+    def __init__(self):
+        self._listeners: dict[int | None, list[MessageListener]] = dict()
+        self._lock = Lock()
+
+    def publish(self, contact_ids: Iterable[int]):
+        contact_ids = set(contact_ids)
+        if not contact_ids:
+            return
+        with self._lock:
+            listeners = [
+                listener
+                for contact_id in (*contact_ids, None)
+                for listener in self._listeners.get(contact_id, [])
+            ]
+        for listener in listeners:
+            listener()
+
+    def subscribe(self, contact_id: int | None, listener: MessageListener):
+        with self._lock:
+            self._listeners.setdefault(contact_id, list()).append(listener)
+
+    def unsubscribe(
+            self,
+            contact_id: int | None,
+            listener: MessageListener,
+        ):
+        with self._lock:
+            listeners = self._listeners.get(contact_id, [])
+            if listener in listeners:
+                listeners.remove(listener)
+            if not listeners:
+                self._listeners.pop(contact_id, None)
+
+message_notifier = MessageNotifier()
+# Publishes changes to the messages waiting in the outbox.
+outbox_notifier = MessageNotifier()
@@ -1,24 +1,32 @@
-from sqlalchemy import Engine, select
-from sqlalchemy.orm import Session
+from sqlalchemy import Engine, delete, select
+from sqlalchemy.orm import Session, subqueryload
 
-from database.models import Contact
+from database.key_rings import invalidate_key_rings
+from database.models import Contact, SyncCursor
 from database.schemas.input import ContactInputSchema
 from database.schemas.output import ContactOutputSchema
 
 def get_contacts(engine: Engine) -> list[ContactOutputSchema]:
+    query = select(Contact).options(
+        subqueryload(Contact.sent_keys),
+        subqueryload(Contact.fernet_keys),
+    )
     with Session(engine) as session:
         result = [
             ContactOutputSchema.model_validate(contact)
-            for contact in session.scalars(select(Contact))
+            for contact in session.scalars(query)
         ]
         return result
 
 def add_contact(engine: Engine, input: ContactInputSchema):
     with Session(engine) as session:
         session.add(Contact(**input.model_dump()))
+        # Data sent by the new contact may predate the sync cursors.
+        session.execute(delete(SyncCursor))
         session.commit()
 
 def remove_contact(engine: Engine, id: int):
     with Session(engine) as session:
         session.delete(session.get_one(Contact, id))
-        session.commit()
\ No newline at end of file
+        session.commit()
+    invalidate_key_rings([id])
\ No newline at end of file
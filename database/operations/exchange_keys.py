@@ -1,41 +1,47 @@
-from base64 import urlsafe_b64encode
 from datetime import datetime
+from typing import Any
 
-from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
-from sqlalchemy import Engine, select
-from sqlalchemy.orm import Session
+from cryptography.hazmat.primitives.asymmetric.x25519 import (
+    X25519PrivateKey,
+    X25519PublicKey,
+)
+from sqlalchemy import Engine, insert, select
+from sqlalchemy.orm import InstrumentedAttribute, Session
 
 from database.models import Contact, ReceivedKey, SentKey
+from database.queries import select_in_chunks
 from database.schemas.input import ReceivedKeyInputSchema, SentKeyInputSchema
 from database.schemas.output import (
-    ContactOutputSchema,
+    ContactSummaryOutputSchema,
     ReceivedKeyOutputSchema,
 )
+from schema_components.validators import base64_to_key
 from server.schemas.responses import FetchedKey
+from server.verification import verify_signatures
 
 def add_fetched_keys(
         engine: Engine,
         fetched_keys: list[FetchedKey],
-    ):
-    """Stores exchange keys retrieved from a server."""
-    contact_cache: dict[bytes, int | None] = dict()
-    with Session(engine).no_autoflush as session:
-        for fetched_key in fetched_keys:
-            exchange_key = _process_fetched_key(
-                session,
-                fetched_key,
-                contact_cache,
-            )
-            if exchange_key is not None:
-                session.add(exchange_key)
+    ) -> int | None:
+    """
+    Store exchange keys retrieved from a server.
+
+    Returns the number of keys stored, or None if they could not be stored.
+    """
+    with Session(engine) as session:
+        rows = _resolve_fetched_keys(session, fetched_keys)
         try:
+            if rows:
+                session.execute(insert(ReceivedKey), rows)
             session.commit()
+            return len(rows)
         except:
             session.rollback()
+            return None
 
 def add_sent_key(
         engine: Engine,
-        contact: ContactOutputSchema,
+        contact: ContactSummaryOutputSchema,
         private_key: X25519PrivateKey,
         initial_key_output: ReceivedKeyOutputSchema | None,
         response_timestamp: datetime | None,
@@ -56,67 +62,79 @@ def add_sent_key(
             session.add(sent_key)
         session.commit()
 
-def _create_received_key_object(
+def _create_received_key_row(
         key: FetchedKey,
         contact_id: int,
         sent_key_id: int | None,
-    ) -> ReceivedKey | None:
+    ) -> dict[str, Any]:
     key_input = ReceivedKeyInputSchema.model_validate({
-        'public_key': key.transmitted_exchange_key,
+        'public_key': base64_to_key(
+            key.transmitted_exchange_key,
+            X25519PublicKey,
+        ),
         'contact_id': contact_id,
         'timestamp': key.timestamp,
         'sent_key_id': sent_key_id,
     })
-    return ReceivedKey(**key_input.model_dump())
+    return key_input.model_dump()
 
-def _get_contact_id(session: Session, key_bytes: bytes) -> int | None:
-    b64_key = urlsafe_b64encode(key_bytes).decode()
-    id_query = (
-        select(Contact.id)
-        .where(Contact.public_key == b64_key)
+def _get_id_map(
+        session: Session,
+        key_column: InstrumentedAttribute[str],
+        id_column: InstrumentedAttribute[int],
+        b64_keys: set[str],
+    ) -> dict[str, int]:
+    rows = select_in_chunks(
+        session,
+        lambda x: select(key_column, id_column).where(key_column.in_(x)),
+        list(b64_keys),
     )
-    return session.scalar(id_query)
+    return {key: id for key, id in rows}
 
-def _get_sent_key_id(session: Session, key_bytes: bytes) -> int | None:
-    b64_key = urlsafe_b64encode(key_bytes).decode()
-    id_query = (
-        select(SentKey.id)
-        .where(SentKey.public_key == b64_key)
+def _resolve_fetched_keys(
+        session: Session,
+        fetched_keys: list[FetchedKey],
+    ) -> list[dict[str, Any]]:
+    transmitted_keys = [x.transmitted_exchange_key for x in fetched_keys]
+    sender_keys = [x.sender_key for x in fetched_keys]
+    initial_keys = [x.initial_exchange_key for x in fetched_keys]
+    # Resolve every key in the batch to a row id with a few queries.
+    stored_keys = set(_get_id_map(
+        session,
+        ReceivedKey.public_key,
+        ReceivedKey.id,
+        set(transmitted_keys),
+    ))
+    contact_ids = _get_id_map(
+        session,
+        Contact.public_key,
+        Contact.id,
+        set(sender_keys),
     )
-    return session.scalar(id_query)
-
-def _is_valid_received_key(session: Session, key_bytes: bytes) -> bool:
-    b64_key = urlsafe_b64encode(key_bytes).decode()
-    query = (
-        select(ReceivedKey)
-        .where(ReceivedKey.public_key == b64_key)
+    sent_key_ids = _get_id_map(
+        session,
+        SentKey.public_key,
+        SentKey.id,
+        {x for x in initial_keys if x is not None},
     )
-    return session.scalar(query) is None
-
-def _is_valid_sent_key_id(session: Session, id: int | None) -> bool:
-    if id is None:
-        return True
-    return session.get(SentKey, id) is not None
-
-def _process_fetched_key(
-        session: Session,
-        key: FetchedKey,
-        cache: dict[bytes, int | None],
-    ) -> ReceivedKey | None:
-    key_bytes = key.transmitted_exchange_key.public_bytes_raw()
-    if not key.is_valid or not _is_valid_received_key(session, key_bytes):
-        return None
-    sender_key_bytes = key.sender_public_key.public_bytes_raw()
-    if sender_key_bytes not in cache:
-        cache[sender_key_bytes] = _get_contact_id(session, sender_key_bytes)
-    contact_id = cache[sender_key_bytes]
-    if contact_id is None:
-        return None
-    if key.initial_exchange_key is not None:
-        sent_key_bytes = key.initial_exchange_key.public_bytes_raw()
-        sent_key_id = _get_sent_key_id(session, sent_key_bytes)
-    else:
-        sent_key_id = None
-    if not _is_valid_sent_key_id(session, sent_key_id):
-        return None
-    return _create_received_key_object(key, contact_id, sent_key_id)
\ No newline at end of file
+    candidates: list[tuple[FetchedKey, int, int | None]] = list()
+    keys = zip(fetched_keys, transmitted_keys, sender_keys, initial_keys)
+    for key, transmitted_key, sender_key, initial_key in keys:
+        if transmitted_key in stored_keys:
+            continue
+        contact_id = contact_ids.get(sender_key)
+        if contact_id is None:
+            continue
+        sent_key_id = sent_key_ids.get(initial_key) if initial_key else None
+        candidates.append((key, contact_id, sent_key_id))
+    verify_signatures([key for key, _, _ in candidates])
+    rows: list[dict[str, Any]] = list()
+    for key, contact_id, sent_key_id in candidates:
+        # Also discard any repeats within the fetched batch itself, counting
+        # only valid keys so that a forgery cannot claim a key first.
+        if key.is_valid and key.transmitted_exchange_key not in stored_keys:
+            stored_keys.add(key.transmitted_exchange_key)
+            rows.append(
+                _create_received_key_row(key, contact_id, sent_key_id),
+            )
+    return rows
\ No newline at end of file
@@ -1,26 +1,92 @@
-from sqlalchemy import Engine, select
+from typing import Sequence
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import (
+    X25519PrivateKey,
+    X25519PublicKey,
+)
+from sqlalchemy import Engine, Row, delete, exists, insert, select, update
 from sqlalchemy.orm import Session
 
-from database.models import FernetKey, ReceivedKey
-from database.schemas.input import FernetKeyInputSchema
-from database.schemas.output import ReceivedKeyOutputSchema
+from database.key_rings import invalidate_key_rings
+from database.models import FernetKey, ReceivedKey, SentKey
+from parallel import parallel_map
+from schema_components.validators import base64_to_raw, raw_to_base64
+from settings import settings
 
 def create_fernet_keys(engine: Engine):
-    """Create symmetric keys from successful key exchanges."""
-    statement = (
-        select(ReceivedKey)
-        .where(ReceivedKey.sent_key != None)
-        .where(ReceivedKey.fernet_key == None)
+    """
+    Create symmetric keys from successful key exchanges.
+
+    Received keys that no key can be derived from, such as low-order points,
+    are deleted, so that they are not tried again.
+    """
+    pending = (
+        (ReceivedKey.fernet_key_id == None)
+        & (ReceivedKey.sent_key_id != None)
     )
     with Session(engine) as session:
-        for obj in session.scalars(statement):
-            received_key = ReceivedKeyOutputSchema.model_validate(obj)
-            assert received_key.sent_key is not None
-            private_key = received_key.sent_key.private_key
-            input = FernetKeyInputSchema.model_validate({
-                'key': private_key.exchange(received_key.public_key),
-                'timestamp': received_key.timestamp,
-                'contact_id': received_key.contact.id,
-            })
-            obj.fernet_key = FernetKey(**input.model_dump())
-        session.commit()
\ No newline at end of file
+        # Most cycles have nothing to derive, so check before selecting.
+        if not session.scalar(select(exists().where(pending))):
+            return
+        # Select only the columns needed, rather than loading relationships.
+        exchanges = session.execute(
+            select(
+                ReceivedKey.id,
+                ReceivedKey.public_key,
+                SentKey.private_key,
+                ReceivedKey.timestamp,
+                ReceivedKey.contact_id,
+            )
+            .join(ReceivedKey.sent_key)
+            .where(pending)
+        ).all()
+        if not exchanges:
+            return
+        keys = _derive_keys(exchanges)
+        derived = [(x, key) for x, key in zip(exchanges, keys) if key]
+        failed_ids = [x.id for x, key in zip(exchanges, keys) if not key]
+        if derived:
+            # Match inserted rows by key, as sorting the returned rows by
+            # parameter order would insert them one at a time.
+            rows = session.execute(
+                insert(FernetKey).returning(FernetKey.key, FernetKey.id),
+                [
+                    {
+                        'key': key,
+                        'timestamp': x.timestamp,
+                        'contact_id': x.contact_id,
+                    }
+                    for x, key in derived
+                ],
+            )
+            fernet_key_ids = {key: id for key, id in rows}
+            session.execute(update(ReceivedKey), [
+                {'id': x.id, 'fernet_key_id': fernet_key_ids[key]}
+                for x, key in derived
+            ])
+        if failed_ids:
+            session.execute(
+                delete(ReceivedKey).where(ReceivedKey.id.in_(failed_ids)),
+            )
+        session.commit()
+    invalidate_key_rings({x.contact_id for x in exchanges})
+
+def _derive_key(exchange: Row) -> str | None:
+    private_key = X25519PrivateKey.from_private_bytes(
+        base64_to_raw(exchange.private_key, 32),
+    )
+    public_key = X25519PublicKey.from_public_bytes(
+        base64_to_raw(exchange.public_key, 32),
+    )
+    try:
+        return raw_to_base64(private_key.exchange(public_key), 32)
+    except ValueError:
+        # Raised for low-order points, which give an all-zero secret.
+        return None
+
+def _derive_keys(exchanges: Sequence[Row]) -> list[str | None]:
+    return parallel_map(
+        _derive_key,
+        exchanges,
+        settings.functionality.key_derivation_workers,
+    )
\ No newline at end of file
@@ -1,124 +1,282 @@
-from base64 import urlsafe_b64encode
 from datetime import datetime
 
-from cryptography.fernet import Fernet, InvalidToken
-from sqlalchemy import Engine, select
+from sqlalchemy import Engine, and_, func, or_, select
 from sqlalchemy.orm import Session
 
-from database.models import Contact, FernetKey, Message, MessageType
+from database.key_rings import FernetKeyRing, get_key_ring
+from database.models import (
+    Contact,
+    Message,
+    MessageType,
+    OutboxMessage,
+    ReceivedKey,
+    SentKey,
+)
+from database.notifications import message_notifier
+from database.queries import select_in_chunks
 from database.schemas.input import MessageInputSchema
-from database.schemas.output import MessageOutputSchema
+from database.schemas.output import (
+    MessageOutputSchema,
+    OutboxMessageOutputSchema,
+)
 from server.schemas.responses import FetchedMessage
+from server.verification import verify_signatures
 
 def add_fetched_messages(
         engine: Engine,
         fetched_messages: list[FetchedMessage],
-    ):
-    """Decrypt and store encrypted messages retrieved from a server."""
-    contact_cache: dict[bytes, tuple[int | None, list[Fernet]]] = dict()
+    ) -> tuple[int, list[FetchedMessage]]:
+    """
+    Decrypt and store encrypted messages retrieved from a server.
+
+    Returns the number of messages stored, along with the messages that
+    could not be decrypted from contacts whose key exchange is incomplete,
+    so that they can be fetched again once it has completed. Messages that
+    no pending exchange could make readable, such as those encrypted with
+    keys discarded when a contact was removed, are not returned. Contacts
+    with newly stored messages are published through the message notifier.
+    """
+    contact_cache: dict[str, tuple[int | None, FernetKeyRing]] = dict()
+    deferred_messages: list[FetchedMessage] = list()
+    contact_ids: set[int] = set()
+    stored_count = 0
     with Session(engine) as session:
-        for fetched_message in fetched_messages:
+        new_messages = _filter_new_messages(session, fetched_messages)
+        for fetched_message in new_messages:
             message = _process_fetched_message(
                 session,
                 fetched_message,
                 contact_cache,
+                deferred_messages,
             )
             if message is not None:
                 session.add(message)
+                contact_ids.add(message.contact_id)
+                stored_count += 1
+        if deferred_messages:
+            awaiting_ids = _get_contacts_awaiting_keys(session, {
+                contact_cache[x.sender_key][0] for x in deferred_messages
+            })
+            deferred_messages = [
+                x for x in deferred_messages
+                if contact_cache[x.sender_key][0] in awaiting_ids
+            ]
         session.commit()
+    message_notifier.publish(contact_ids)
+    return stored_count, deferred_messages
 
 def add_posted_message(
         engine: Engine,
-        plaintext: str,
-        contact_id: int,
+        outbox_message: OutboxMessageOutputSchema,
         timestamp: datetime,
         nonce: int,
     ):
-    """Store a posted message after posting an encrypted copy."""
-    message_input = MessageInputSchema.model_validate({
-        'text': plaintext,
-        'contact_id': contact_id,
-        'message_type': MessageType.SENT,
-        'timestamp': timestamp,
-        'nonce': nonce,
-    })
+    """Store a posted message, removing it from the outbox."""
+    add_posted_messages(engine, [(outbox_message, timestamp, nonce)])
+
+def add_posted_messages(
+        engine: Engine,
+        posted_messages: list[tuple[OutboxMessageOutputSchema, datetime, int]],
+    ):
+    """
+    Store posted messages in one transaction, removing them from the outbox.
+
+    Each message is supplied with the timestamp and nonce returned by the
+    server. Nothing is stored for a message that has left the outbox in the
+    meantime, as happens when the contact is removed. A message posted again
+    after being stored has the same nonce, and is only removed from the
+    outbox.
+    """
+    message_inputs = [
+        (outbox_message.id, MessageInputSchema.model_validate({
+            'text': outbox_message.text,
+            'contact_id': outbox_message.contact.id,
+            'message_type': MessageType.SENT,
+            'timestamp': timestamp,
+            'nonce': nonce,
+        }))
+        for outbox_message, timestamp, nonce in posted_messages
+    ]
+    contact_ids: set[int] = set()
     with Session(engine) as session:
-        session.add(Message(**message_input.model_dump()))
+        query = select(OutboxMessage).where(
+            OutboxMessage.id.in_([id for id, _ in message_inputs]),
+        )
+        queued_messages = {x.id: x for x in session.scalars(query)}
+        stored_nonces = _get_stored_nonces(
+            session,
+            [x.nonce for _, x in message_inputs],
+        )
+        for id, message_input in message_inputs:
+            queued_message = queued_messages.get(id)
+            if queued_message is None:
+                continue
+            if message_input.nonce not in stored_nonces:
+                stored_nonces.add(message_input.nonce)
+                session.add(Message(**message_input.model_dump()))
+            session.delete(queued_message)
+            contact_ids.add(message_input.contact_id)
         session.commit()
+    message_notifier.publish(contact_ids)
 
-def fetch_unloaded_messages(
+def fetch_message_page(
         engine: Engine,
         contact_id: int,
-        loaded_nonces: list[str],
+        limit: int,
+        before: tuple[datetime, int] | None = None,
     ) -> list[MessageOutputSchema]:
+    """
+    Retrieve a page of the latest messages exchanged with a contact.
+
+    If a (timestamp, id) key is supplied, only messages ordered before it
+    are retrieved. Messages are returned in chronological order.
+    """
     query = (
         select(Message)
         .where(Message.contact_id == contact_id)
-        .where(~Message.nonce.in_(loaded_nonces))
-        .order_by(Message.timestamp)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        timestamp, id = before
+        # The inclusive bound lets the index narrow the range scan.
+        query = query.where(Message.timestamp <= timestamp).where(
+            or_(
+                Message.timestamp < timestamp,
+                and_(Message.timestamp == timestamp, Message.id < id),
+            ),
+        )
+    with Session(engine) as session:
+        messages = session.scalars(query).all()
+        return [
+            MessageOutputSchema.model_validate(x) for x in reversed(messages)
+        ]
+
+def fetch_new_messages(
+        engine: Engine,
+        contact_id: int,
+        last_message_id: int,
+    ) -> list[MessageOutputSchema]:
+    """
+    Retrieve a contact's messages stored after a given message.
+
+    Message ids increase as messages are stored, so this finds messages
+    whose server timestamps predate those already loaded. Messages are
+    returned in chronological order.
+    """
+    query = (
+        select(Message)
+        .where(Message.id > last_message_id)
+        # Prevent use of the contact index so that the id range is searched.
+        .where(Message.contact_id + 0 == contact_id)
+        .order_by(Message.timestamp, Message.id)
     )
     with Session(engine) as session:
         messages = session.scalars(query)
         return [MessageOutputSchema.model_validate(x) for x in messages]
 
+def get_last_message_id(engine: Engine) -> int:
+    """
+    Retrieve the greatest id of any stored message, or 0 if there are none.
+
+    Messages stored later have greater ids, so this bounds the search for
+    new messages in conversations that have none yet.
+    """
+    with Session(engine) as session:
+        return session.scalar(select(func.max(Message.id))) or 0
+
 def _create_fetched_message_object(
         msg: FetchedMessage,
         contact_id: int,
-        fernet_keys: list[Fernet],
+        key_ring: FernetKeyRing,
     ) -> Message | None:
-    for key in fernet_keys:
-        try:
-            plaintext = key.decrypt(msg.encrypted_text)
-            message_input = MessageInputSchema.model_validate({
-                'text': plaintext,
-                'message_type': MessageType.RECEIVED,
-                'contact_id': contact_id,
-                'timestamp': msg.timestamp,
-                'nonce': msg.nonce,
-            })
-            return Message(**message_input.model_dump())
-        except InvalidToken:
-            continue
+    plaintext = key_ring.decrypt(msg.encrypted_text)
+    if plaintext is None:
+        return None
+    message_input = MessageInputSchema.model_validate({
+        'text': plaintext,
+        'message_type': MessageType.RECEIVED,
+        'contact_id': contact_id,
+        'timestamp': msg.timestamp,
+        'nonce': msg.nonce,
+    })
+    return Message(**message_input.model_dump())
+
+def _get_contacts_awaiting_keys(
+        session: Session,
+        contact_ids: set[int],
+    ) -> set[int]:
+    # A contact awaits keys while a sent key is unanswered, a received key
+    # has not been used to derive a Fernet key, or no Fernet key exists.
+    awaiting_keys = or_(
+        Contact.sent_keys.any(~SentKey.received_keys.any()),
+        Contact.received_keys.any(ReceivedKey.fernet_key_id == None),
+        ~Contact.fernet_keys.any(),
+    )
+    rows = select_in_chunks(
+        session,
+        lambda x: select(Contact.id).where(Contact.id.in_(x), awaiting_keys),
+        list(contact_ids),
+    )
+    return {id for id, in rows}
 
 def _get_contact_info(
         session: Session,
-        key_bytes: bytes,
-    ) -> tuple[int | None, list[Fernet]]:
-    b64_key = urlsafe_b64encode(key_bytes).decode()
+        b64_key: str,
+    ) -> tuple[int | None, FernetKeyRing]:
     id_query = (
         select(Contact.id)
         .where(Contact.public_key == b64_key)
     )
     contact_id = session.scalar(id_query)
     if contact_id is None:
-        return None, []
-    keys_query = (
-        select(FernetKey.key)
-        .where(FernetKey.contact != None)
-        .join(Contact)
-        .where(Contact.public_key == b64_key)
-        .order_by(FernetKey.timestamp.desc())
+        return None, FernetKeyRing([])
+    return contact_id, get_key_ring(session, contact_id)
+
+def _filter_new_messages(
+        session: Session,
+        fetched_messages: list[FetchedMessage],
+    ) -> list[FetchedMessage]:
+    stored_nonces = _get_stored_nonces(
+        session,
+        [hex(x.nonce) for x in fetched_messages],
     )
-    return contact_id, [Fernet(x) for x in session.scalars(keys_query)]
+    unstored_messages = [
+        x for x in fetched_messages if hex(x.nonce) not in stored_nonces
+    ]
+    verify_signatures(unstored_messages)
+    new_messages: list[FetchedMessage] = list()
+    for msg in unstored_messages:
+        nonce = hex(msg.nonce)
+        # Also discard any repeats within the fetched batch itself, counting
+        # only valid messages so that a forgery cannot claim a nonce first.
+        if msg.is_valid and nonce not in stored_nonces:
+            stored_nonces.add(nonce)
+            new_messages.append(msg)
+    return new_messages
 
-def _is_valid_nonce(session: Session, nonce: str) -> bool:
-    query = (
-        select(Message)
-        .where(Message.nonce == nonce)
+def _get_stored_nonces(session: Session, nonces: list[str]) -> set[str]:
+    rows = select_in_chunks(
+        session,
+        lambda x: select(Message.nonce).where(Message.nonce.in_(x)),
+        nonces,
     )
-    return session.scalar(query) is None
+    return {nonce for nonce, in rows}
 
 def _process_fetched_message(
         session: Session,
         msg: FetchedMessage,
-        cache: dict[bytes, tuple[int | None, list[Fernet]]],
+        cache: dict[str, tuple[int | None, FernetKeyRing]],
+        deferred: list[FetchedMessage],
     ) -> Message | None:
-    if not msg.is_valid or not _is_valid_nonce(session, hex(msg.nonce)):
+    if not msg.is_valid:
         return None
-    public_key_bytes = msg.sender_public_key.public_bytes_raw()
-    if public_key_bytes not in cache:
-        cache[public_key_bytes] = _get_contact_info(session, public_key_bytes)
-    contact_id, fernet_keys = cache[public_key_bytes]
+    if msg.sender_key not in cache:
+        cache[msg.sender_key] = _get_contact_info(session, msg.sender_key)
+    contact_id, key_ring = cache[msg.sender_key]
     if contact_id is None:
         return None
-    return _create_fetched_message_object(msg, contact_id, fernet_keys)
\ No newline at end of file
+    message = _create_fetched_message_object(msg, contact_id, key_ring)
+    if message is None:
+        deferred.append(msg)
+    return message
\ No newline at end of file
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Engine, delete, select
+from sqlalchemy.orm import Session, joinedload
+
+from database.models import OutboxMessage, OutboxStatus
+from database.notifications import outbox_notifier
+from database.schemas.input import OutboxMessageInputSchema
+from database.schemas.output import OutboxMessageOutputSchema
+from server.scheduling import get_backoff
+
+def add_outbox_message(engine: Engine, input: OutboxMessageInputSchema):
+    """Queue an encrypted message to be posted by the delivery worker."""
+    with Session(engine) as session:
+        session.add(OutboxMessage(**input.model_dump()))
+        session.commit()
+    outbox_notifier.publish([input.contact_id])
+
+def get_outbox_messages(
+        engine: Engine,
+        contact_id: int | None = None,
+    ) -> list[OutboxMessageOutputSchema]:
+    """Retrieve queued messages in the order they were queued."""
+    query = (
+        select(OutboxMessage)
+        .options(joinedload(OutboxMessage.contact))
+        .order_by(OutboxMessage.id)
+    )
+    if contact_id is not None:
+        query = query.where(OutboxMessage.contact_id == contact_id)
+    with Session(engine) as session:
+        return [
+            OutboxMessageOutputSchema.model_validate(x)
+            for x in session.scalars(query)
+        ]
+
+def dismiss_outbox_message(engine: Engine, id: int):
+    """Remove a message that failed to be posted from the outbox."""
+    with Session(engine) as session:
+        contact_id = session.scalar(
+            delete(OutboxMessage)
+            .where(OutboxMessage.id == id)
+            .where(OutboxMessage.status == OutboxStatus.FAILED)
+            .returning(OutboxMessage.contact_id),
+        )
+        session.commit()
+    if contact_id is not None:
+        outbox_notifier.publish([contact_id])
+
+def record_failed_delivery(engine: Engine, id: int, permanent: bool):
+    """
+    Record a failed attempt to post a queued message.
+
+    A message rejected outright is marked as failed and not retried. Any
+    other message is retried after a delay that doubles with each attempt,
+    bounded by the scheduling backoff settings.
+    """
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, id)
+        if message is None:
+            return
+        message.attempts += 1
+        if permanent:
+            message.status = OutboxStatus.FAILED
+        else:
+            delay = get_backoff(message.attempts - 1)
+            message.next_attempt = (
+                datetime.now(timezone.utc) + timedelta(seconds=delay)
+            )
+        contact_id = message.contact_id
+        session.commit()
+    # Messages awaiting a retry are displayed as before.
+    if permanent:
+        outbox_notifier.publish([contact_id])
+
+def retry_outbox_message(engine: Engine, id: int):
+    """Queue a message that failed to be posted to be posted again."""
+    with Session(engine) as session:
+        message = session.get(OutboxMessage, id)
+        if message is None or message.status != OutboxStatus.FAILED:
+            return
+        message.status = OutboxStatus.PENDING
+        message.attempts = 0
+        message.next_attempt = None
+        contact_id = message.contact_id
+        session.commit()
+    outbox_notifier.publish([contact_id])
\ No newline at end of file
@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import Collection
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from database.models import Contact, SyncCursor
+from database.schemas.input import SyncCursorInputSchema
+from schema_components.validators import datetime_to_utc, key_to_base64
+
+def get_sync_cursor(
+        engine: Engine,
+        public_key: Ed25519PublicKey,
+    ) -> datetime | None:
+    """Retrieve the latest fully synchronised server timestamp."""
+    query = (
+        select(SyncCursor.timestamp)
+        .where(SyncCursor.public_key == key_to_base64(public_key))
+    )
+    with Session(engine) as session:
+        timestamp = session.scalar(query)
+    if timestamp is None:
+        return None
+    return datetime_to_utc(timestamp)
+
+def advance_sync_cursor(
+        engine: Engine,
+        public_key: Ed25519PublicKey,
+        timestamp: datetime,
+        sender_keys: Collection[str],
+    ):
+    """
+    Move the sync cursor forward, ignoring attempts to move it back.
+
+    The cursor is left unchanged if any contact's key is missing from the
+    sender keys the data was fetched for, as the contact was added since and
+    its earlier data has yet to be fetched.
+    """
+    input = SyncCursorInputSchema.model_validate({
+        'public_key': public_key,
+        'timestamp': timestamp,
+    })
+    query = (
+        select(SyncCursor)
+        .where(SyncCursor.public_key == input.public_key)
+    )
+    with Session(engine) as session:
+        contact_keys = session.scalars(select(Contact.public_key))
+        if any(x not in sender_keys for x in contact_keys):
+            return
+        cursor = session.scalar(query)
+        if cursor is None:
+            session.add(SyncCursor(**input.model_dump()))
+        elif datetime_to_utc(cursor.timestamp) < input.timestamp:
+            cursor.timestamp = input.timestamp
+        session.commit()
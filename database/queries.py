@@ -0,0 +1,21 @@
+from typing import Any, Callable, Iterator, Sequence
+
+from sqlalchemy import Row, Select
+from sqlalchemy.orm import Session
+
+# Kept well below SQLite's historical limit of 999 bound parameters.
+_CHUNK_SIZE = 500
+
+def select_in_chunks[T](
+        session: Session,
+        build_query: Callable[[Sequence[T]], Select[Any]],
+        values: Sequence[T],
+    ) -> Iterator[Row[Any]]:
+    """
+    Run a query built for each chunk of values, yielding every row.
+
+    Queries that match many values with IN are split so that no statement
+    binds more parameters than SQLite allows.
+    """
+    for i in range(0, len(values), _CHUNK_SIZE):
+        yield from session.execute(build_query(values[i:i + _CHUNK_SIZE]))
\ No newline at end of file
@@ -105,14 +105,16 @@
 #     key: _Key
 #     timestamp: Annotated[datetime, AfterValidator(_validate_timestamp)]
 #     contact_id: int
-from typing import Annotated
-
-from pydantic import BaseModel, BeforeValidator
+from pydantic import BaseModel
 
 from database.models import MessageType
 from schema_components.types.common import UTCTimestamp
-from schema_components.types.input import HexNonce, Key
-from schema_components.validators import raw_to_base64
+from schema_components.types.input import (
+    EncryptedMessage,
+    HexNonce,
+    Key,
+    Signature,
+)
 
 class ContactInputSchema(BaseModel):
     name: str
@@ -120,14 +122,6 @@ class ContactInputSchema(BaseModel):
     class Config:
         from_attributes = True
 
-class FernetKeyInputSchema(BaseModel):
-    key: Annotated[
-        str,
-        BeforeValidator(lambda x: raw_to_base64(x, 32)),
-    ]
-    timestamp: UTCTimestamp
-    contact_id: int
-
 class MessageInputSchema(BaseModel):
     text: str
     timestamp: UTCTimestamp
@@ -135,6 +129,13 @@ class MessageInputSchema(BaseModel):
     contact_id: int
     nonce: HexNonce
 
+class OutboxMessageInputSchema(BaseModel):
+    text: str
+    encrypted_text: EncryptedMessage
+    signature: Signature
+    idempotency_key: str
+    contact_id: int
+
 class SentKeyInputSchema(BaseModel):
     private_key: Key
     public_key: Key
@@ -144,4 +145,8 @@ class ReceivedKeyInputSchema(BaseModel):
     public_key: Key
     timestamp: UTCTimestamp
     contact_id: int
-    sent_key_id: int | None = None
\ No newline at end of file
+    sent_key_id: int | None = None
+
+class SyncCursorInputSchema(BaseModel):
+    public_key: Key
+    timestamp: UTCTimestamp
\ No newline at end of file
@@ -132,10 +132,13 @@
 
 # class ReceivedKeyOutputSchema(BaseModel):
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
+from database.models import OutboxStatus
 from schema_components.types.common import UTCTimestamp
 from schema_components.types.output import (
+    Base64Key,
+    Base64Signature,
     FernetKey,
     IntNonce,
     PrivateExchangeKey,
@@ -143,16 +146,20 @@ from schema_components.types.output import (
     PublicVerificationKey,
 )
 
-class ContactOutputSchema(BaseModel):
+class ContactSummaryOutputSchema(BaseModel):
     id: int
     name: str
     public_key: PublicVerificationKey
-    sent_keys: 'list[SentKeyOutputSchema]'
-    fernet_keys: 'list[FernetKeyOutputSchema]'
+    # The stored encoding, so that requests need not encode the key again.
+    encoded_public_key: Base64Key = Field(validation_alias='public_key')
     class Config:
         arbitrary_types_allowed = True
         from_attributes = True
 
+class ContactOutputSchema(ContactSummaryOutputSchema):
+    sent_keys: 'list[SentKeyOutputSchema]'
+    fernet_keys: 'list[FernetKeyOutputSchema]'
+
 class MessageOutputSchema(BaseModel):
     id: int
     text: str
@@ -163,6 +170,21 @@ class MessageOutputSchema(BaseModel):
     class Config:
         from_attributes = True
 
+class OutboxMessageOutputSchema(BaseModel):
+    id: int
+    text: str
+    encrypted_text: str
+    # Left encoded, as it is only ever sent back to the server.
+    signature: Base64Signature
+    idempotency_key: str
+    status: OutboxStatus
+    attempts: int
+    next_attempt: UTCTimestamp | None
+    contact: ContactSummaryOutputSchema
+    class Config:
+        arbitrary_types_allowed = True
+        from_attributes = True
+
 class _ExchangeKeyOutputSchema(BaseModel):
     public_key: PublicExchangeKey
     class Config:
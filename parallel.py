@@ -0,0 +1,33 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Sequence
+
+# Smaller batches are processed on the calling thread.
+_MIN_PARALLEL_ITEMS = 64
+
+def parallel_map[T, R](
+        function: Callable[[T], R],
+        items: Sequence[T],
+        workers: int | None = None,
+        min_parallel: int = _MIN_PARALLEL_ITEMS,
+    ) -> list[R]:
+    """
+    Apply a function to each item across a thread pool, keeping their order.
+
+    The items are split into one chunk for each worker, and the number of
+    workers defaults to the number of CPUs. Fewer than min_parallel items
+    are processed on the calling thread, where a pool would cost more than
+    it saves.
+    """
+    workers = workers or os.cpu_count()
+    if not workers or workers == 1 or len(items) < min_parallel:
+        return [function(x) for x in items]
+    chunk_size = -(-len(items) // workers)
+    chunks = [
+        items[i:i + chunk_size]
+        for i in range(0, len(items), chunk_size)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda x: [function(y) for y in x], chunks)
+        return [x for chunk_results in results for x in chunk_results]
\ No newline at end of file
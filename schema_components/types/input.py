@@ -1,11 +1,13 @@
 from typing import Annotated
 
-from pydantic import BeforeValidator
+from pydantic import AfterValidator, BeforeValidator
 
 from schema_components.validators import (
+    canonicalise_base64_key,
+    canonicalise_base64_signature,
     datetime_to_str,
-    key_to_base64,
-    raw_to_base64,
+    encode_key,
+    encode_signature,
     validate_hex_nonce,
 )
 
@@ -14,13 +16,16 @@ type HexNonce = Annotated[
     int | str,
     BeforeValidator(validate_hex_nonce),
 ]
+# Values already encoded are only decoded if they are not canonical.
 type Key = Annotated[
     str,
-    BeforeValidator(key_to_base64),
+    BeforeValidator(encode_key),
+    AfterValidator(canonicalise_base64_key),
 ]
 type Signature = Annotated[
     str,
-    BeforeValidator(lambda x: raw_to_base64(x, 64)),
+    BeforeValidator(encode_signature),
+    AfterValidator(canonicalise_base64_signature),
 ]
 type StringTimestamp = Annotated[
     str,
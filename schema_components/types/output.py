@@ -6,11 +6,14 @@ from cryptography.hazmat.primitives.asymmetric.x25519 import (
     X25519PrivateKey,
     X25519PublicKey,
 )
-from pydantic import AfterValidator, BeforeValidator
+from pydantic import AfterValidator, BeforeValidator, StringConstraints
 
 from schema_components.validators import (
     base64_to_raw,
     base64_to_key,
+    canonicalise_base64_key,
+    canonicalise_base64_signature,
+    intern_base64_key,
     raw_to_base64,
     validate_int_nonce,
 )
@@ -48,4 +51,23 @@ type FernetKeyBytes = Annotated[
 type Signature = Annotated[
     bytes,
     BeforeValidator(lambda x: base64_to_raw(x, 64)),
+]
+# Types checked without decoding, for values read from the database.
+type Base64Key = Annotated[
+    str,
+    StringConstraints(pattern=r'^[A-Za-z0-9_-]{43}=$'),
+]
+# Types decoded and re-encoded unless already canonical, for values that
+# are compared with stored keys or may use another Base64 alphabet.
+type Base64Signature = Annotated[
+    str,
+    AfterValidator(canonicalise_base64_signature),
+]
+type CanonicalKey = Annotated[
+    str,
+    AfterValidator(canonicalise_base64_key),
+]
+type InternedKey = Annotated[
+    str,
+    AfterValidator(intern_base64_key),
 ]
\ No newline at end of file
@@ -1,7 +1,9 @@
 import binascii
+import re
 
 from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timezone
+from functools import lru_cache
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives.asymmetric.ed25519 import (
@@ -18,6 +20,10 @@ type _PublicKey = Ed25519PublicKey | X25519PublicKey
 type _PrivateKeyType = type[Ed25519PrivateKey] | type[X25519PrivateKey]
 type _PublicKeyType = type[Ed25519PublicKey] | type[X25519PublicKey]
 
+# The canonical encodings of 32 and 64 bytes, whose unused bits are zero.
+_CANONICAL_KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]{42}[AEIMQUYcgkosw048]=')
+_CANONICAL_SIGNATURE_PATTERN = re.compile(r'[A-Za-z0-9_-]{85}[AQgw]==')
+
 def raw_to_base64(value: bytes, length: int | None = None) -> str:
     if length is not None and len(value) != length:
         raise ValueError(
@@ -31,7 +37,23 @@ def key_to_base64(key: _PrivateKey | _PublicKey) -> str:
     else:
         return urlsafe_b64encode(key.public_bytes_raw()).decode()
 
+def encode_key(value: str | _PrivateKey | _PublicKey) -> str:
+    """Encode a key as Base64, passing through keys already encoded."""
+    if isinstance(value, str):
+        return value
+    return key_to_base64(value)
+
+def encode_signature(value: str | bytes) -> str:
+    """Encode a signature as Base64, passing through encoded signatures."""
+    if isinstance(value, str):
+        return value
+    return raw_to_base64(value, 64)
+
 def base64_to_raw(value: str | bytes, length: int | None = None) -> bytes:
+    # Accept values with their padding omitted.
+    padding = -len(value) % 4
+    if padding:
+        value += '=' * padding if isinstance(value, str) else b'=' * padding
     try:
         raw_bytes = urlsafe_b64decode(value)
         if length is not None and len(raw_bytes) != length:
@@ -54,6 +76,28 @@ def base64_to_key(
     else:
         return output_type(value)
     
+def canonicalise_base64_key(value: str) -> str:
+    """Validate a Base64 key, returning the one canonical encoding of it."""
+    if _CANONICAL_KEY_PATTERN.fullmatch(value):
+        return value
+    return raw_to_base64(base64_to_raw(value, 32))
+
+def canonicalise_base64_signature(value: str) -> str:
+    """Validate a Base64 signature, returning its canonical encoding."""
+    if _CANONICAL_SIGNATURE_PATTERN.fullmatch(value):
+        return value
+    return raw_to_base64(base64_to_raw(value, 64))
+
+@lru_cache(maxsize=1024)
+def intern_base64_key(value: str) -> str:
+    """Validate a Base64 key, returning one shared copy per distinct key."""
+    return canonicalise_base64_key(value)
+
+@lru_cache(maxsize=1024)
+def load_verification_key(value: str) -> Ed25519PublicKey:
+    """Load a Base64 verification key, sharing one object per key."""
+    return Ed25519PublicKey.from_public_bytes(base64_to_raw(value, 32))
+
 def datetime_to_utc(value: datetime):
     return value.replace(tzinfo=timezone.utc)
 
@@ -0,0 +1,64 @@
+import time
+
+from threading import Lock
+from typing import Callable
+
+from settings import settings
+
+type ConnectionListener = Callable[[bool], None]
+
+class ConnectionState:
+    """
+    Whether the server can be reached, judged from the outcomes of requests.
+
+    Any response shows that the server can be reached, whatever its status,
+    while a transport error shows that it cannot. Clients created by
+    server.transport report the outcome of every request they make, so the
+    server only needs to be pinged once no request has completed for a
+    while.
+
+    Listeners are called with the new state whenever it changes, from the
+    thread that made the request, so listeners belonging to the UI must hand
+    work to the Tk main thread.
+    """
+    def __init__(self, connected: bool = False):
+        self._connected = connected
+        self._last_outcome: float | None = None
+        self._listeners: list[ConnectionListener] = list()
+        self._lock = Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def is_silent(self) -> bool:
+        """Return whether the connection is due to be checked by a ping."""
+        last_outcome = self._last_outcome
+        return (
+            last_outcome is None
+            or time.monotonic() - last_outcome >= settings.server.ping_after
+        )
+
+    def record_failure(self):
+        self._record(False)
+
+    def record_success(self):
+        self._record(True)
+
+    def subscribe(self, listener: ConnectionListener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ConnectionListener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _record(self, connected: bool):
+        with self._lock:
+            self._last_outcome = time.monotonic()
+            changed = connected != self._connected
+            self._connected = connected
+            listeners = list(self._listeners) if changed else []
+        for listener in listeners:
+            listener(connected)
@@ -5,4 +5,7 @@ class ClientError(Exception):
     pass
 
 class ServerError(Exception):
+    pass
+
+class UnsupportedEndpoint(Exception):
     pass
\ No newline at end of file
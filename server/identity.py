@@ -0,0 +1,30 @@
+from functools import lru_cache
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+    Ed25519PrivateKey,
+    Ed25519PublicKey,
+)
+
+from schema_components.validators import key_to_base64, raw_to_base64
+
+class Identity:
+    """
+    The user's signature key, with the encodings every request needs.
+
+    The public key is derived and encoded once, rather than for each request
+    built. Identities are shared through get_identity, which returns the same
+    identity for as long as the same signature key is in use.
+    """
+    def __init__(self, signature_key: Ed25519PrivateKey):
+        self.signature_key = signature_key
+        self.public_key: Ed25519PublicKey = signature_key.public_key()
+        self.encoded_public_key = key_to_base64(self.public_key)
+
+    def sign(self, data: bytes) -> str:
+        """Sign data, returning the signature encoded as Base64."""
+        return raw_to_base64(self.signature_key.sign(data), 64)
+
+@lru_cache(maxsize=4)
+def get_identity(signature_key: Ed25519PrivateKey) -> Identity:
+    """Return the identity of a signature key, creating it on first use."""
+    return Identity(signature_key)
\ No newline at end of file
@@ -1,141 +1,492 @@
+import asyncio
+import os
+import time
+
+from datetime import datetime, timezone
+from itertools import chain
+from typing import Any, Callable, Coroutine
+
 import httpx
 
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives.asymmetric.ed25519 import (
-    Ed25519PrivateKey,
-    Ed25519PublicKey,
-)
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from pydantic import BaseModel
 from sqlalchemy import Engine, select
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, subqueryload
 
-from database.models import Contact, ReceivedKey
+from database.key_rings import get_key_ring
+from database.models import Contact, OutboxStatus, ReceivedKey
 from database.operations.messages import (
     add_fetched_messages,
     add_posted_message,
+    add_posted_messages,
 )
 from database.operations.exchange_keys import add_fetched_keys, add_sent_key
+from database.operations.outbox import (
+    add_outbox_message,
+    get_outbox_messages,
+    record_failed_delivery,
+)
+from database.operations.sync_cursors import (
+    advance_sync_cursor,
+    get_sync_cursor,
+)
+from database.schemas.input import OutboxMessageInputSchema
 from database.schemas.output import (
-    ContactOutputSchema,
+    ContactSummaryOutputSchema,
+    OutboxMessageOutputSchema,
     ReceivedKeyOutputSchema,
 )
+from schema_components.validators import datetime_to_str
 from server.exceptions import (
     MissingFernetKey,
     ClientError,
     ServerError,
+    UnsupportedEndpoint,
 )
+from server.identity import get_identity
 from server.schemas.requests import (
     FetchDataRequest,
+    LongPollFetchDataRequest,
     PostKeyRequestModel,
+    PostMessageBatchRequestModel,
     PostMessageRequestModel,
 )
 from server.schemas.responses import (
     FetchDataResponse,
+    FetchedKey,
+    FetchedMessage,
     PostKeyResponseModel,
+    PostMessageBatchResponseModel,
     PostMessageResponseModel,
 )
+from server.transport import encode_request, get_timeout
 from settings import settings
 
-def check_connection(http_client: httpx.Client) -> bool:
+# Status codes indicating that the server does not offer an endpoint.
+_UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+
+# Monotonic time before which messages are not posted in batches, set when
+# the server reports that it does not offer batch posting.
+_batch_retry_time = 0.0
+
+type _FetchedElement = FetchedKey | FetchedMessage
+
+class _PagedFetch:
+    """
+    Stores fetched data page by page, in chunks committed separately.
+
+    The sync cursor is advanced after each chunk, but never past a message
+    that could not be decrypted while its sender's key exchange is still
+    incomplete, nor once exchange keys could not be stored. Nor is it
+    advanced if a contact was added after the fetch was requested, as the
+    new contact's data was not requested. Progress is reported with the
+    number of elements processed so far whenever more elements remain,
+    while new_elements counts only the messages and keys that were not
+    already stored.
+    """
+    def __init__(
+            self,
+            engine: Engine,
+            signature_key: Ed25519PrivateKey,
+            on_progress: Callable[[int], Any] | None,
+        ):
+        self.engine = engine
+        self.public_key = get_identity(signature_key).public_key
+        self.on_progress = on_progress
+        self.new_elements = 0
+        self.stored_elements = 0
+        self.holding_cursor = False
+
+    def store_page(
+            self,
+            request: FetchDataRequest,
+            raw_response: httpx.Response,
+        ) -> FetchDataRequest | None:
+        """
+        Store a page of fetched data, returning a request for the next.
+
+        Raises ClientError or ServerError if the server reports an error.
+        """
+        _check_response_status(raw_response)
+        if raw_response.status_code != 200:
+            return None
+        # Validate straight from the body, without building Python objects.
+        response = FetchDataResponse.model_validate_json(raw_response.content)
+        elements: list[_FetchedElement] = sorted(
+            chain(response.data.exchange_keys, response.data.messages),
+            key=lambda x: x.timestamp,
+        )
+        min_datetime = None
+        if request.min_datetime is not None:
+            min_datetime = datetime.fromisoformat(request.min_datetime)
+        sender_keys = set(request.sender_keys or [])
+        chunk_size = settings.server.fetch_page_size
+        for i in range(0, len(elements), chunk_size):
+            self._store_chunk(elements[i:i + chunk_size], sender_keys)
+            if i + chunk_size < len(elements) or response.data.has_more:
+                self._report_progress()
+        if not response.data.has_more or not elements:
+            return None
+        # Stop rather than request the same page again.
+        cursor = elements[-1].timestamp
+        if min_datetime is not None and cursor <= min_datetime:
+            return None
+        return FetchDataRequest.model_construct(
+            public_key=request.public_key,
+            sender_keys=request.sender_keys,
+            min_datetime=datetime_to_str(cursor),
+            limit=request.limit,
+        )
+
+    def _report_progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self.stored_elements)
+
+    def _store_chunk(
+            self,
+            elements: list[_FetchedElement],
+            sender_keys: set[str],
+        ):
+        keys = [x for x in elements if isinstance(x, FetchedKey)]
+        messages = [x for x in elements if isinstance(x, FetchedMessage)]
+        deferred_messages: list[FetchedMessage] = list()
+        # Store keys first, so that messages sent under exchanges they begin
+        # are held until those exchanges complete.
+        if keys:
+            stored_count = add_fetched_keys(self.engine, keys)
+            if stored_count is None:
+                self.holding_cursor = True
+            else:
+                self.new_elements += stored_count
+        if messages:
+            stored_count, deferred_messages = add_fetched_messages(
+                self.engine,
+                messages,
+            )
+            self.new_elements += stored_count
+        if not self.holding_cursor:
+            if deferred_messages:
+                cursor = min(x.timestamp for x in deferred_messages)
+                self.holding_cursor = True
+            else:
+                cursor = elements[-1].timestamp
+            advance_sync_cursor(
+                self.engine,
+                self.public_key,
+                cursor,
+                sender_keys,
+            )
+        self.stored_elements += len(elements)
+
+async def check_connection_async(http_client: httpx.AsyncClient) -> bool:
+    """
+    Ping the server, returning whether it could be reached.
+
+    A client created by server.transport also records the outcome, so this
+    is only needed once its connection state has been silent for a while.
+    """
     try:
-        http_client.get(
+        await http_client.get(
             url=settings.server.ping_url,
             timeout=settings.server.ping_timeout,
         )
         return True
-    except (httpx.ConnectError, httpx.TimeoutException):
+    except httpx.TransportError:
         return False
 
-def fetch_data(
+def deliver_outbox_messages(
         engine: Engine,
         signature_key: Ed25519PrivateKey,
         http_client: httpx.Client,
     ):
-    """Fetch all data stored on the server that is addressed to the user."""
-    with Session(engine) as session:
-        contact_dict: dict[str, int] = {
-            x.public_key: x.id
-            for x in session.scalars(select(Contact))
-        }
-    if not contact_dict:
-        return
-    request = FetchDataRequest.model_validate({
-        'public_key': signature_key.public_key(),
-        'sender_keys': [x for x in contact_dict.keys()],
-    })
-    raw_response = http_client.post(
-        url=settings.server.fetch_data_url,
-        json=request.model_dump(),
+    """
+    Post queued messages that are due, storing each once it is posted.
+
+    Messages to each contact are posted in the order they were queued, and
+    a failed post holds back the contact's later messages. Messages rejected
+    by the server are marked as failed, while other failures are retried
+    after a backoff and then raised. Each message carries an idempotency
+    key, so a message posted again after its response was lost is not
+    duplicated by the server.
+
+    When several messages are due they are posted in batches, falling back
+    to posting them one at a time if the server does not accept batches. A
+    server that does not offer batch posting is not asked again until the
+    batch retry interval has passed.
+    """
+    deliverable = _get_deliverable_messages(engine)
+    if _should_batch(deliverable):
+        try:
+            for batch in _batch_messages(deliverable):
+                post_message_batch(engine, signature_key, http_client, batch)
+            return
+        except (UnsupportedEndpoint, ClientError) as error:
+            _record_batch_error(error)
+            deliverable = _get_deliverable_messages(engine)
+    for messages in deliverable:
+        _deliver_messages(engine, signature_key, http_client, messages)
+
+async def deliver_outbox_messages_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+    ):
+    """
+    Deliver messages as above, posting batches in turn or, if the server
+    does not accept batches, posting to different contacts concurrently.
+    """
+    deliverable = await asyncio.to_thread(_get_deliverable_messages, engine)
+    if _should_batch(deliverable):
+        try:
+            for batch in _batch_messages(deliverable):
+                await post_message_batch_async(
+                    engine,
+                    signature_key,
+                    http_client,
+                    batch,
+                )
+            return
+        except (UnsupportedEndpoint, ClientError) as error:
+            _record_batch_error(error)
+            deliverable = await asyncio.to_thread(
+                _get_deliverable_messages,
+                engine,
+            )
+    await _gather_limited(semaphore, [
+        _deliver_messages_async(engine, signature_key, http_client, x)
+        for x in deliverable
+    ])
+
+def fetch_data(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.Client,
+        on_progress: Callable[[int], Any] | None = None,
+    ) -> int:
+    """
+    Fetch data stored on the server that is addressed to the user.
+
+    Only data timestamped at or after the sync cursor for the user's public
+    key is requested. Data is requested in pages and stored in chunks of at
+    most the configured page size, each committed before the next is stored,
+    so a large backlog is never held in memory at once. The cursor is
+    advanced as chunks are stored, but never past a message that could not
+    be decrypted while its sender's key exchange is incomplete. While more
+    data remains, on_progress is called with the number of elements
+    processed so far. Returns the number of messages and keys stored that
+    were not already stored, so elements fetched again behind a held cursor
+    are not counted.
+    """
+    request = _create_fetch_data_request(engine, signature_key)
+    if request is None:
+        return 0
+    fetch = _PagedFetch(engine, signature_key, on_progress)
+    while request is not None:
+        raw_response = _post(
+            http_client,
+            settings.server.fetch_data_url,
+            request,
+            settings.server.transport.fetch_timeout,
+        )
+        request = fetch.store_page(request, raw_response)
+    return fetch.new_elements
+
+async def fetch_data_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        on_progress: Callable[[int], Any] | None = None,
+    ) -> int:
+    """
+    Fetch data as in fetch_data, running database work in threads.
+
+    Progress is reported from those threads.
+    """
+    request = await asyncio.to_thread(
+        _create_fetch_data_request,
+        engine,
+        signature_key,
+    )
+    if request is None:
+        return 0
+    fetch = _PagedFetch(engine, signature_key, on_progress)
+    await _fetch_pages_async(fetch, http_client, request)
+    return fetch.new_elements
+
+async def long_poll_data_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        on_progress: Callable[[int], Any] | None = None,
+    ) -> int | None:
+    """
+    Fetch data as in fetch_data, waiting on the server until it exists.
+
+    The server holds the request open until it has data newer than the sync
+    cursor or the long-poll timeout passes. Returns None without contacting
+    the server if there are no contacts to fetch data from, and raises
+    UnsupportedEndpoint if the server does not offer long polling.
+    """
+    request = await asyncio.to_thread(
+        _create_fetch_data_request,
+        engine,
+        signature_key,
+        settings.server.long_poll_timeout,
     )
-    if raw_response.status_code == 200:
-        response = FetchDataResponse.model_validate(raw_response.json())
-        add_fetched_messages(engine, response.data.messages)
-        add_fetched_keys(engine, response.data.exchange_keys)
+    if request is None:
+        return None
+    raw_response = await _post_async(
+        http_client,
+        settings.server.long_poll_url,
+        request,
+        (
+            settings.server.long_poll_timeout
+            + settings.server.transport.fetch_timeout
+        ),
+    )
+    if raw_response.status_code in _UNSUPPORTED_STATUS_CODES:
+        raise UnsupportedEndpoint(raw_response)
+    _check_response_status(raw_response)
+    # Any remaining pages are fetched without waiting.
+    fetch = _PagedFetch(engine, signature_key, on_progress)
+    next_request = await asyncio.to_thread(
+        fetch.store_page,
+        request,
+        raw_response,
+    )
+    await _fetch_pages_async(fetch, http_client, next_request)
+    return fetch.new_elements
 
 def post_exchange_key(
         engine: Engine,
         signature_key: Ed25519PrivateKey,
         http_client: httpx.Client,
-        contact: ContactOutputSchema,
+        contact: ContactSummaryOutputSchema,
         initial_key: ReceivedKeyOutputSchema | None = None,
     ):
-    private_key = X25519PrivateKey.generate()
-    public_key = private_key.public_key()
-    request = PostKeyRequestModel.model_validate({
-        'public_key': signature_key.public_key(),
-        'recipient_public_key': contact.public_key,
-        'transmitted_exchange_key': public_key,
-        'initial_exchange_key': (
-            initial_key.public_key if initial_key is not None else None
-        ),
-        'signature': signature_key.sign(public_key.public_bytes_raw()),
-    })
-    raw_response = http_client.post(
-        url = settings.server.post_exchange_key_url,
-        json=request.model_dump(),
+    private_key, request = _create_post_key_request(
+        signature_key,
+        contact,
+        initial_key,
     )
-    if 400 <= raw_response.status_code < 500:
-        raise ClientError(raw_response)
-    elif 500 <= raw_response.status_code:
-        raise ServerError(raw_response)
-    response = PostKeyResponseModel.model_validate(raw_response.json())
-    add_sent_key(
-        engine=engine,
-        contact=contact,
-        private_key=private_key,
-        initial_key_output=initial_key,
-        response_timestamp=response.data.timestamp,
+    raw_response = _post(
+        http_client,
+        settings.server.post_exchange_key_url,
+        request,
+        settings.server.transport.post_timeout,
+    )
+    _store_sent_key(engine, contact, initial_key, private_key, raw_response)
+
+async def post_exchange_key_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        contact: ContactSummaryOutputSchema,
+        initial_key: ReceivedKeyOutputSchema | None = None,
+    ):
+    private_key, request = _create_post_key_request(
+        signature_key,
+        contact,
+        initial_key,
+    )
+    raw_response = await _post_async(
+        http_client,
+        settings.server.post_exchange_key_url,
+        request,
+        settings.server.transport.post_timeout,
+    )
+    await asyncio.to_thread(
+        _store_sent_key,
+        engine,
+        contact,
+        initial_key,
+        private_key,
+        raw_response,
     )
 
-# TODO expand outputs to avoid this clunky workaround rather than
-# essentially doing a join
 def post_initial_contact_keys(
         engine: Engine,
         signature_key: Ed25519PrivateKey,
         http_client: httpx.Client,
     ):
-    with Session(engine) as session:
-        for obj in session.scalars(select(Contact)):
-            contact = ContactOutputSchema.model_validate(obj)
-            if not contact.sent_keys:
-                post_exchange_key(engine, signature_key, http_client, contact)
+    for contact in _get_contacts_without_keys(engine):
+        post_exchange_key(engine, signature_key, http_client, contact)
 
-def post_pending_exchange_keys(
+async def post_initial_contact_keys_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+    ):
+    """Post initial keys concurrently, limited by the semaphore."""
+    contacts = await asyncio.to_thread(_get_contacts_without_keys, engine)
+    await _gather_limited(semaphore, [
+        post_exchange_key_async(engine, signature_key, http_client, contact)
+        for contact in contacts
+    ])
+
+def post_message_batch(
         engine: Engine,
         signature_key: Ed25519PrivateKey,
         http_client: httpx.Client,
+        messages: list[OutboxMessageOutputSchema],
     ):
-    with Session(engine) as session:
-        query = (
-            select(ReceivedKey)
-            .where(ReceivedKey.sent_key == None)
-            .where(ReceivedKey.fernet_key == None)
+    """
+    Post queued messages in a single request, then store those posted.
+
+    The server posts the messages in order and reports on each, and every
+    posted message is stored in one transaction. Messages the server rejects
+    are marked as failed. Raises UnsupportedEndpoint if the server does not
+    offer batch posting, and ClientError if it rejects the batch as a whole,
+    in which case no messages are posted.
+    """
+    request = _create_post_batch_request(signature_key, messages)
+    try:
+        raw_response = _post(
+            http_client,
+            settings.server.post_messages_url,
+            request,
+            settings.server.transport.post_timeout,
         )
-        received_keys = [
-            ReceivedKeyOutputSchema.model_validate(x)
-            for x in session.scalars(query).all()
-        ]
-    for received_key in received_keys:
+        _check_batch_response_status(raw_response)
+    except (httpx.TransportError, ServerError):
+        _record_retries(engine, messages)
+        raise
+    _store_posted_batch(engine, messages, raw_response)
+
+async def post_message_batch_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        messages: list[OutboxMessageOutputSchema],
+    ):
+    request = _create_post_batch_request(signature_key, messages)
+    try:
+        raw_response = await _post_async(
+            http_client,
+            settings.server.post_messages_url,
+            request,
+            settings.server.transport.post_timeout,
+        )
+        _check_batch_response_status(raw_response)
+    except (httpx.TransportError, ServerError):
+        await asyncio.to_thread(_record_retries, engine, messages)
+        raise
+    await asyncio.to_thread(
+        _store_posted_batch,
+        engine,
+        messages,
+        raw_response,
+    )
+
+def post_pending_exchange_keys(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.Client,
+    ):
+    for received_key in _get_pending_received_keys(engine):
         post_exchange_key(
             engine=engine,
             signature_key=signature_key,
@@ -144,37 +495,377 @@ def post_pending_exchange_keys(
             initial_key=received_key,
         )
 
-def post_message(
+async def post_pending_exchange_keys_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+    ):
+    """Post response keys concurrently, limited by the semaphore."""
+    received_keys = await asyncio.to_thread(
+        _get_pending_received_keys,
+        engine,
+    )
+    await _gather_limited(semaphore, [
+        post_exchange_key_async(
+            engine=engine,
+            signature_key=signature_key,
+            http_client=http_client,
+            contact=received_key.contact,
+            initial_key=received_key,
+        )
+        for received_key in received_keys
+    ])
+
+def queue_message(
         engine: Engine,
         signature_key: Ed25519PrivateKey,
-        http_client: httpx.Client,
         plaintext: str,
-        contact: ContactOutputSchema,
+        contact: ContactSummaryOutputSchema,
     ):
-    """Post a specified message to the server, storing it on success."""
-    contact_public_key, fernet_key = _get_message_keys(contact)
+    """
+    Encrypt and sign a message, then queue it to be posted to the contact.
+
+    Raises MissingFernetKey if no key exchange with the contact has been
+    completed.
+    """
+    with Session(engine) as session:
+        fernet_key = get_key_ring(session, contact.id).latest
+    if fernet_key is None:
+        raise MissingFernetKey(f'No fernet keys exist for {contact.name}')
     ciphertext = fernet_key.encrypt(plaintext.encode())
-    request = PostMessageRequestModel.model_validate({
-        'public_key': signature_key.public_key(),
-        'recipient_public_key': contact_public_key,
+    add_outbox_message(engine, OutboxMessageInputSchema.model_validate({
+        'text': plaintext,
         'encrypted_text': ciphertext.decode(),
         'signature': signature_key.sign(ciphertext),
-    })
-    raw_response = http_client.post(
-        url = settings.server.post_message_url,
-        json=request.model_dump(),
-    )
+        'idempotency_key': os.urandom(16).hex(),
+        'contact_id': contact.id,
+    }))
+
+def _batch_messages(
+        deliverable: list[list[OutboxMessageOutputSchema]],
+    ) -> list[list[OutboxMessageOutputSchema]]:
+    # Batches are posted in turn, so each contact's messages stay in order.
+    messages = list(chain.from_iterable(deliverable))
+    size = settings.server.post_batch_size
+    return [messages[i:i + size] for i in range(0, len(messages), size)]
+
+def _check_batch_response_status(raw_response: httpx.Response):
+    if raw_response.status_code in _UNSUPPORTED_STATUS_CODES:
+        raise UnsupportedEndpoint(raw_response)
+    _check_response_status(raw_response)
+
+def _check_response_status(raw_response: httpx.Response):
     if 400 <= raw_response.status_code < 500:
         raise ClientError(raw_response)
     elif 500 <= raw_response.status_code:
-        raise ServerError(raw_response) 
-    response = PostMessageResponseModel.model_validate(raw_response.json())
+        raise ServerError(raw_response)
+
+def _create_fetch_data_request(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        long_poll_timeout: float | None = None,
+    ) -> FetchDataRequest | None:
+    with Session(engine) as session:
+        sender_keys = list(session.scalars(select(Contact.public_key)))
+    if not sender_keys:
+        return None
+    identity = get_identity(signature_key)
+    values: dict[str, Any] = {
+        'public_key': identity.encoded_public_key,
+        'sender_keys': sender_keys,
+        'min_datetime': get_sync_cursor(engine, identity.public_key),
+        'limit': settings.server.fetch_page_size,
+    }
+    if long_poll_timeout is not None:
+        values['timeout'] = long_poll_timeout
+        return LongPollFetchDataRequest.model_validate(values)
+    return FetchDataRequest.model_validate(values)
+
+def _create_post_batch_request(
+        signature_key: Ed25519PrivateKey,
+        messages: list[OutboxMessageOutputSchema],
+    ) -> PostMessageBatchRequestModel:
+    # Requests that are already validated are not validated again.
+    return PostMessageBatchRequestModel(messages=[
+        _create_post_message_request(signature_key, x) for x in messages
+    ])
+
+def _create_post_key_request(
+        signature_key: Ed25519PrivateKey,
+        contact: ContactSummaryOutputSchema,
+        initial_key: ReceivedKeyOutputSchema | None,
+    ) -> tuple[X25519PrivateKey, PostKeyRequestModel]:
+    identity = get_identity(signature_key)
+    private_key = X25519PrivateKey.generate()
+    public_key = private_key.public_key()
+    request = PostKeyRequestModel.model_validate({
+        'public_key': identity.encoded_public_key,
+        'recipient_public_key': contact.encoded_public_key,
+        'transmitted_exchange_key': public_key,
+        'initial_exchange_key': (
+            initial_key.public_key if initial_key is not None else None
+        ),
+        'signature': identity.sign(public_key.public_bytes_raw()),
+    })
+    return private_key, request
+
+def _create_post_message_request(
+        signature_key: Ed25519PrivateKey,
+        message: OutboxMessageOutputSchema,
+    ) -> PostMessageRequestModel:
+    # Every key and signature is passed already encoded, leaving only their
+    # format to be checked.
+    return PostMessageRequestModel.model_validate({
+        'public_key': get_identity(signature_key).encoded_public_key,
+        'recipient_public_key': message.contact.encoded_public_key,
+        'encrypted_text': message.encrypted_text,
+        'signature': message.signature,
+        'idempotency_key': message.idempotency_key,
+    })
+
+def _deliver_messages(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.Client,
+        messages: list[OutboxMessageOutputSchema],
+    ):
+    for message in messages:
+        request = _create_post_message_request(signature_key, message)
+        try:
+            raw_response = _post(
+                http_client,
+                settings.server.post_message_url,
+                request,
+                settings.server.transport.post_timeout,
+            )
+            _check_response_status(raw_response)
+        except ClientError:
+            record_failed_delivery(engine, message.id, permanent=True)
+            continue
+        except (httpx.TransportError, ServerError):
+            record_failed_delivery(engine, message.id, permanent=False)
+            raise
+        _store_posted_message(engine, message, raw_response)
+
+async def _deliver_messages_async(
+        engine: Engine,
+        signature_key: Ed25519PrivateKey,
+        http_client: httpx.AsyncClient,
+        messages: list[OutboxMessageOutputSchema],
+    ):
+    for message in messages:
+        request = _create_post_message_request(signature_key, message)
+        try:
+            raw_response = await _post_async(
+                http_client,
+                settings.server.post_message_url,
+                request,
+                settings.server.transport.post_timeout,
+            )
+            _check_response_status(raw_response)
+        except ClientError:
+            await asyncio.to_thread(
+                record_failed_delivery,
+                engine,
+                message.id,
+                permanent=True,
+            )
+            continue
+        except (httpx.TransportError, ServerError):
+            await asyncio.to_thread(
+                record_failed_delivery,
+                engine,
+                message.id,
+                permanent=False,
+            )
+            raise
+        await asyncio.to_thread(
+            _store_posted_message,
+            engine,
+            message,
+            raw_response,
+        )
+
+async def _fetch_pages_async(
+        fetch: _PagedFetch,
+        http_client: httpx.AsyncClient,
+        request: FetchDataRequest | None,
+    ):
+    while request is not None:
+        raw_response = await _post_async(
+            http_client,
+            settings.server.fetch_data_url,
+            request,
+            settings.server.transport.fetch_timeout,
+        )
+        request = await asyncio.to_thread(
+            fetch.store_page,
+            request,
+            raw_response,
+        )
+
+async def _gather_limited(
+        semaphore: asyncio.Semaphore,
+        coroutines: list[Coroutine[Any, Any, None]],
+    ):
+    async def run(coroutine: Coroutine[Any, Any, None]):
+        async with semaphore:
+            await coroutine
+    results = await asyncio.gather(
+        *(run(x) for x in coroutines),
+        return_exceptions=True,
+    )
+    # Only raise once every post has finished, so none are abandoned.
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+def _get_contacts_without_keys(
+        engine: Engine,
+    ) -> list[ContactSummaryOutputSchema]:
+    query = (
+        select(Contact.id, Contact.name, Contact.public_key)
+        .where(~Contact.sent_keys.any())
+    )
+    with Session(engine) as session:
+        return [
+            ContactSummaryOutputSchema.model_validate(x)
+            for x in session.execute(query)
+        ]
+
+def _get_deliverable_messages(
+        engine: Engine,
+    ) -> list[list[OutboxMessageOutputSchema]]:
+    """Group the queued messages that are due to be posted by contact."""
+    now = datetime.now(timezone.utc)
+    deliverable: dict[int, list[OutboxMessageOutputSchema]] = dict()
+    waiting: set[int] = set()
+    for message in get_outbox_messages(engine):
+        contact_id = message.contact.id
+        if message.status != OutboxStatus.PENDING or contact_id in waiting:
+            continue
+        elif message.next_attempt is not None and message.next_attempt > now:
+            # Later messages must not be posted ahead of this one.
+            waiting.add(contact_id)
+            continue
+        deliverable.setdefault(contact_id, list()).append(message)
+    return list(deliverable.values())
+
+def _get_pending_received_keys(
+        engine: Engine,
+    ) -> list[ReceivedKeyOutputSchema]:
+    contact = subqueryload(ReceivedKey.contact)
+    with Session(engine) as session:
+        query = (
+            select(ReceivedKey)
+            .options(
+                contact.subqueryload(Contact.sent_keys),
+                contact.subqueryload(Contact.fernet_keys),
+            )
+            .where(ReceivedKey.sent_key == None)
+            .where(ReceivedKey.fernet_key == None)
+        )
+        return [
+            ReceivedKeyOutputSchema.model_validate(x)
+            for x in session.scalars(query).all()
+        ]
+
+def _post(
+        http_client: httpx.Client,
+        url: str,
+        request: BaseModel,
+        timeout: float,
+    ) -> httpx.Response:
+    content, headers = encode_request(request)
+    return http_client.post(
+        url=url,
+        content=content,
+        headers=headers,
+        timeout=get_timeout(timeout),
+    )
+
+async def _post_async(
+        http_client: httpx.AsyncClient,
+        url: str,
+        request: BaseModel,
+        timeout: float,
+    ) -> httpx.Response:
+    content, headers = encode_request(request)
+    return await http_client.post(
+        url=url,
+        content=content,
+        headers=headers,
+        timeout=get_timeout(timeout),
+    )
+
+def _record_batch_error(error: UnsupportedEndpoint | ClientError):
+    global _batch_retry_time
+    if isinstance(error, UnsupportedEndpoint):
+        _batch_retry_time = (
+            time.monotonic() + settings.server.batch_retry_interval
+        )
+
+def _record_retries(
+        engine: Engine,
+        messages: list[OutboxMessageOutputSchema],
+    ):
+    for message in messages:
+        record_failed_delivery(engine, message.id, permanent=False)
+
+def _should_batch(
+        deliverable: list[list[OutboxMessageOutputSchema]],
+    ) -> bool:
+    return (
+        sum(len(x) for x in deliverable) > 1
+        and time.monotonic() >= _batch_retry_time
+    )
+
+def _store_posted_batch(
+        engine: Engine,
+        messages: list[OutboxMessageOutputSchema],
+        raw_response: httpx.Response,
+    ):
+    response = PostMessageBatchResponseModel.model_validate_json(
+        raw_response.content,
+    )
+    if len(response.data.results) != len(messages):
+        _record_retries(engine, messages)
+        raise ServerError(raw_response)
+    results = list(zip(messages, response.data.results))
+    for message, result in results:
+        if result.data is None:
+            record_failed_delivery(engine, message.id, permanent=True)
+    add_posted_messages(engine, [
+        (message, result.data.timestamp, result.data.nonce)
+        for message, result in results
+        if result.data is not None
+    ])
+
+def _store_posted_message(
+        engine: Engine,
+        message: OutboxMessageOutputSchema,
+        raw_response: httpx.Response,
+    ):
+    response = PostMessageResponseModel.model_validate_json(
+        raw_response.content,
+    )
     timestamp, nonce = (response.data.timestamp, response.data.nonce)
-    add_posted_message(engine, plaintext, contact.id, timestamp, nonce)
+    add_posted_message(engine, message, timestamp, nonce)
 
-def _get_message_keys(
-        contact: ContactOutputSchema,
-    ) -> tuple[Ed25519PublicKey, Fernet]:
-    if not contact.fernet_keys:
-        raise MissingFernetKey(f'No fernet keys exist for {contact.name}')
-    return contact.public_key, contact.fernet_keys[-1].key
\ No newline at end of file
+def _store_sent_key(
+        engine: Engine,
+        contact: ContactSummaryOutputSchema,
+        initial_key: ReceivedKeyOutputSchema | None,
+        private_key: X25519PrivateKey,
+        raw_response: httpx.Response,
+    ):
+    _check_response_status(raw_response)
+    response = PostKeyResponseModel.model_validate(raw_response.json())
+    add_sent_key(
+        engine=engine,
+        contact=contact,
+        private_key=private_key,
+        initial_key_output=initial_key,
+        response_timestamp=response.data.timestamp,
+    )
\ No newline at end of file
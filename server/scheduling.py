@@ -0,0 +1,56 @@
+import random
+
+from settings import settings
+
+# Limits the exponent so that the backoff calculation cannot overflow.
+_MAX_BACKOFF_EXPONENT = 32
+
+def get_backoff(failures: int) -> float:
+    """
+    Return the backoff in seconds after a number of consecutive failures.
+
+    The backoff doubles with each failure from the configured base, up to
+    the configured ceiling.
+    """
+    scheduling = settings.server.scheduling
+    return min(
+        scheduling.backoff_base * 2 ** min(failures, _MAX_BACKOFF_EXPONENT),
+        scheduling.backoff_ceiling,
+    )
+
+class AdaptiveScheduler:
+    """
+    Choose the delay before each synchronisation cycle.
+
+    The delay drops to the burst interval while new data is arriving and is
+    capped at the focused interval while a message window has focus. When
+    idle it grows by a constant factor up to a ceiling. While disconnected,
+    reconnection attempts back off exponentially with full jitter.
+    """
+    def __init__(self, rng: random.Random | None = None):
+        self.rng = rng or random.Random()
+        self.interval = settings.server.operations_sleep
+        self.failures = 0
+
+    def next_delay(
+            self,
+            connected: bool,
+            new_elements: int,
+            focused: bool,
+        ) -> float:
+        scheduling = settings.server.scheduling
+        if not connected:
+            ceiling = get_backoff(self.failures)
+            self.failures += 1
+            return self.rng.uniform(0, ceiling)
+        self.failures = 0
+        if new_elements:
+            self.interval = scheduling.burst_interval
+        else:
+            self.interval = min(
+                self.interval * scheduling.idle_growth,
+                scheduling.idle_ceiling,
+            )
+        if focused:
+            return min(self.interval, scheduling.focused_interval)
+        return self.interval
\ No newline at end of file
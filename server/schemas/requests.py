@@ -105,7 +105,15 @@ class PostKeyRequestModel(_BasePostRequestModel):
 
 class PostMessageRequestModel(_BasePostRequestModel):
     encrypted_text: EncryptedMessage
+    idempotency_key: str | None = None
+
+class PostMessageBatchRequestModel(BaseModel):
+    messages: list[PostMessageRequestModel]
 
 class FetchDataRequest(_BaseRequestModel):
     sender_keys: list[str] | None = None
-    min_datetime: StringTimestamp | None = None
\ No newline at end of file
+    min_datetime: StringTimestamp | None = None
+    limit: int | None = None
+
+class LongPollFetchDataRequest(FetchDataRequest):
+    timeout: float
\ No newline at end of file
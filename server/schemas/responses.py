@@ -189,15 +189,17 @@
 from functools import cached_property
 
 from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
 from pydantic import AliasChoices, BaseModel, Field
 
 from schema_components.types.common import UTCTimestamp
 from schema_components.types.output import (
+    Base64Signature,
+    CanonicalKey,
     IntNonce,
-    PublicExchangeKey,
-    PublicVerificationKey,
-    Signature,
+    InternedKey,
 )
+from schema_components.validators import base64_to_raw, load_verification_key
 
 class _BaseResponseModel(BaseModel):
     status: str
@@ -212,6 +214,16 @@ class _PostMessageResponseData(BaseModel):
 class PostMessageResponseModel(_BaseResponseModel):
     data: _PostMessageResponseData
 
+class _PostMessageBatchResult(_BaseResponseModel):
+    """The outcome of posting one message, holding data if successful."""
+    data: _PostMessageResponseData | None = None
+
+class _PostMessageBatchResponseData(BaseModel):
+    results: list[_PostMessageBatchResult]
+
+class PostMessageBatchResponseModel(_BaseResponseModel):
+    data: _PostMessageBatchResponseData
+
 class _PostKeyResponseData(BaseModel):
     timestamp: UTCTimestamp
 
@@ -221,21 +233,38 @@ class PostKeyResponseModel(_BaseResponseModel):
 # Fetch requests:
 
 class _FetchAbstractDataResponseElement(BaseModel):
-    sender_public_key: PublicVerificationKey = Field(
+    """
+    An element of a fetch response, holding its keys and signature as Base64.
+
+    Fetched elements are frequently discarded as already stored, so keys are
+    only loaded and signatures only decoded once an element is checked.
+    """
+    sender_key: InternedKey = Field(
         validation_alias=AliasChoices(
             'sender_public_key',
             'sender_key',
         )
     )
-    signature: Signature
+    signature: Base64Signature
     timestamp: UTCTimestamp
-    
-    class Config:
-        arbitrary_types_allowed = True
+
+    @cached_property
+    def sender_public_key(self) -> Ed25519PublicKey:
+        return load_verification_key(self.sender_key)
+
+    def _verify(self, data: bytes) -> bool:
+        try:
+            self.sender_public_key.verify(
+                base64_to_raw(self.signature, 64),
+                data,
+            )
+            return True
+        except InvalidSignature:
+            return False
 
 
 class FetchedKey(_FetchAbstractDataResponseElement):
-    transmitted_exchange_key: PublicExchangeKey = Field(
+    transmitted_exchange_key: CanonicalKey = Field(
         validation_alias=AliasChoices(
             'transmitted_exchange_key',
             'key',
@@ -243,7 +272,7 @@ class FetchedKey(_FetchAbstractDataResponseElement):
             'transmitted_key',
         ),
     )
-    initial_exchange_key: PublicExchangeKey | None = Field(
+    initial_exchange_key: CanonicalKey | None = Field(
         default=None,
         validation_alias=AliasChoices(
             'initial_exchange_key',
@@ -252,14 +281,7 @@ class FetchedKey(_FetchAbstractDataResponseElement):
     )
     @cached_property
     def is_valid(self):
-        try:
-            self.sender_public_key.verify(
-                self.signature,
-                self.transmitted_exchange_key.public_bytes_raw(),
-            )
-            return True
-        except InvalidSignature:
-            return False
+        return self._verify(base64_to_raw(self.transmitted_exchange_key, 32))
 
 
 class _FetchExchangeKeysResponseDataModel(BaseModel):
@@ -280,14 +302,7 @@ class FetchedMessage(_FetchAbstractDataResponseElement):
     nonce: IntNonce
     @cached_property
     def is_valid(self):
-        try:
-            self.sender_public_key.verify(
-                self.signature,
-                self.encrypted_text.encode(),
-            )
-            return True
-        except InvalidSignature:
-            return False
+        return self._verify(self.encrypted_text.encode())
 
 
 class _FetchMessagesResponseDataModel(BaseModel):
@@ -307,6 +322,8 @@ class FetchMessagesResponseModel(_BaseResponseModel):
 class _FetchDataResponseData(BaseModel):
     exchange_keys: list[FetchedKey]
     messages: list[FetchedMessage]
+    # Set by servers that limit the elements returned for each request.
+    has_more: bool = False
 
 
 class FetchDataResponse(_BaseResponseModel):
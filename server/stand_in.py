@@ -0,0 +1,354 @@
+"""
+A local stand-in for a server running the Cryptcord API.
+
+Data is held in memory, so the stand-in is only suitable for development and
+offline end-to-end testing. Run it from the repository root with:
+
+    python -m server.stand_in --port 8000
+"""
+import argparse
+import gzip
+import json
+import os
+import socket
+
+from base64 import urlsafe_b64decode
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from threading import Condition, Lock, Thread
+from typing import Any
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+# Upper bound on how long a long-poll request may be held open.
+_MAX_LONG_POLL_TIMEOUT = 60.0
+# Responses smaller than this many bytes are sent uncompressed.
+_MIN_COMPRESSED_SIZE = 1024
+
+class _Store:
+    def __init__(self):
+        self.messages: list[dict[str, Any]] = list()
+        self.exchange_keys: list[dict[str, Any]] = list()
+        self.posted_messages: dict[str, dict[str, Any]] = dict()
+        self.condition = Condition()
+        self._last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+
+    def add(self, elements: list[dict[str, Any]], element: dict[str, Any]):
+        with self.condition:
+            # Keep timestamps strictly increasing so that cursors are exact.
+            timestamp = max(
+                datetime.now(timezone.utc),
+                self._last_timestamp + timedelta(microseconds=1),
+            )
+            self._last_timestamp = timestamp
+            element['timestamp'] = timestamp
+            elements.append(element)
+            self.condition.notify_all()
+        return element
+
+    def add_message(self, element: dict[str, Any]) -> dict[str, Any]:
+        """Add a message, unless one with its idempotency key exists."""
+        idempotency_key = element.pop('idempotency_key')
+        with self.condition:
+            # A repeated post returns the message stored the first time.
+            if idempotency_key in self.posted_messages:
+                return self.posted_messages[idempotency_key]
+            element['nonce'] = os.urandom(16).hex()
+            self.add(self.messages, element)
+            if idempotency_key is not None:
+                self.posted_messages[idempotency_key] = element
+        return element
+
+    def fetch(
+            self,
+            public_key: str,
+            sender_keys: list[str] | None,
+            min_datetime: datetime | None,
+            strictly_newer: bool = False,
+            limit: int | None = None,
+        ) -> dict[str, Any]:
+        def is_match(element: dict[str, Any]) -> bool:
+            if element['recipient_public_key'] != public_key:
+                return False
+            if sender_keys is not None:
+                if element['sender_public_key'] not in sender_keys:
+                    return False
+            if min_datetime is None:
+                return True
+            elif strictly_newer:
+                return element['timestamp'] > min_datetime
+            return element['timestamp'] >= min_datetime
+        messages = [x for x in self.messages if is_match(x)]
+        exchange_keys = [x for x in self.exchange_keys if is_match(x)]
+        has_more = False
+        if limit is not None and len(messages) + len(exchange_keys) > limit:
+            # Return only the oldest elements, which have unique timestamps.
+            timestamps = sorted(
+                x['timestamp'] for x in chain(messages, exchange_keys)
+            )
+            boundary = timestamps[limit - 1]
+            messages = [x for x in messages if x['timestamp'] <= boundary]
+            exchange_keys = [
+                x for x in exchange_keys if x['timestamp'] <= boundary
+            ]
+            has_more = True
+        return {
+            'messages': [_serialise(x) for x in messages],
+            'exchange_keys': [_serialise(x) for x in exchange_keys],
+            'has_more': has_more,
+        }
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server: 'StandInServer'
+    # Keep connections alive, as every response has a content length, and
+    # send headers and bodies without waiting for acknowledgements.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == '/ping':
+            self._respond(200, 'Pong.')
+        else:
+            self._respond(404, 'Not found.')
+
+    def do_POST(self):
+        routes = {
+            '/data/post/message': self._post_message,
+            '/data/post/messages': self._post_messages,
+            '/data/post/exchange-key': self._post_exchange_key,
+            '/data/fetch': self._fetch_data,
+            '/data/fetch/wait': self._long_poll_data,
+        }
+        # Always read the body, so that the connection can be reused.
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        route = routes.get(self.path)
+        if route is None:
+            self._respond(404, 'Not found.')
+            return
+        try:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                content = gzip.decompress(content)
+            route(json.loads(content))
+        except (KeyError, TypeError, ValueError, EOFError, gzip.BadGzipFile):
+            self._respond(400, 'Malformed request.')
+
+    def log_message(self, format: str, *args: Any):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _fetch_data(self, body: dict[str, Any]):
+        store = self.server.store
+        with store.condition:
+            data = store.fetch(
+                body['public_key'],
+                body.get('sender_keys'),
+                _parse_timestamp(body.get('min_datetime')),
+                limit=_parse_limit(body.get('limit')),
+            )
+        self._respond(200, 'Data retrieved.', data)
+
+    def _long_poll_data(self, body: dict[str, Any]):
+        store = self.server.store
+        args = (
+            body['public_key'],
+            body.get('sender_keys'),
+            _parse_timestamp(body.get('min_datetime')),
+        )
+        timeout = min(float(body['timeout']), _MAX_LONG_POLL_TIMEOUT)
+        limit = _parse_limit(body.get('limit'))
+        # Wait for data newer than the cursor, then include the boundary.
+        with store.condition:
+            store.condition.wait_for(
+                lambda: any(store.fetch(*args, strictly_newer=True).values()),
+                timeout=timeout,
+            )
+            data = store.fetch(*args, limit=limit)
+        self._respond(200, 'Data retrieved.', data)
+
+    def _post_exchange_key(self, body: dict[str, Any]):
+        signed_data = urlsafe_b64decode(body['transmitted_exchange_key'])
+        if not _is_valid_signature(body, signed_data):
+            self._respond(400, 'Invalid signature.')
+            return
+        element = self.server.store.add(self.server.store.exchange_keys, {
+            'sender_public_key': body['public_key'],
+            'recipient_public_key': body['recipient_public_key'],
+            'transmitted_exchange_key': body['transmitted_exchange_key'],
+            'initial_exchange_key': body.get('initial_exchange_key'),
+            'signature': body['signature'],
+        })
+        self._respond(201, 'Exchange key posted.', {
+            'timestamp': element['timestamp'].isoformat(),
+        })
+
+    def _post_message(self, body: dict[str, Any]):
+        element = _create_message(body)
+        if element is None:
+            self._respond(400, 'Invalid signature.')
+            return
+        element = self.server.store.add_message(element)
+        self._respond(201, 'Message posted.', {
+            'timestamp': element['timestamp'].isoformat(),
+            'nonce': element['nonce'],
+        })
+
+    def _post_messages(self, body: dict[str, Any]):
+        # Read every message before storing any, so malformed batches are
+        # rejected as a whole.
+        elements = [_create_message(x) for x in body['messages']]
+        results: list[dict[str, Any]] = list()
+        for element in elements:
+            if element is None:
+                results.append({
+                    'status': 'error',
+                    'message': 'Invalid signature.',
+                })
+                continue
+            element = self.server.store.add_message(element)
+            results.append({
+                'status': 'success',
+                'message': 'Message posted.',
+                'data': {
+                    'timestamp': element['timestamp'].isoformat(),
+                    'nonce': element['nonce'],
+                },
+            })
+        self._respond(200, 'Messages posted.', {'results': results})
+
+    def _respond(
+            self,
+            status_code: int,
+            message: str,
+            data: dict[str, Any] | None = None,
+        ):
+        status = 'success' if status_code < 400 else 'error'
+        body: dict[str, Any] = {'status': status, 'message': message}
+        if data is not None:
+            body['data'] = data
+        content = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        accepted = self.headers.get('Accept-Encoding', '')
+        if len(content) >= _MIN_COMPRESSED_SIZE and 'gzip' in accepted:
+            content = gzip.compress(content, compresslevel=6)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+class StandInServer(ThreadingHTTPServer):
+    """An in-memory Cryptcord API server, served from background threads."""
+    daemon_threads = True
+
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 8000,
+            verbose: bool = False,
+        ):
+        super().__init__((host, port), _RequestHandler)
+        self.store = _Store()
+        self.verbose = verbose
+        self.connections: set[socket.socket] = set()
+        self._connections_lock = Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> Thread:
+        """Serve requests from a daemon thread until shutdown is called."""
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def process_request(self, request: Any, client_address: Any):
+        with self._connections_lock:
+            self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def server_close(self):
+        """Stop listening and drop connections that are being kept alive."""
+        super().server_close()
+        with self._connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def shutdown_request(self, request: Any):
+        with self._connections_lock:
+            self.connections.discard(request)
+        super().shutdown_request(request)
+
+def _create_message(body: dict[str, Any]) -> dict[str, Any] | None:
+    """Read a posted message, returning None if its signature is invalid."""
+    element = {
+        'sender_public_key': body['public_key'],
+        'recipient_public_key': body['recipient_public_key'],
+        'encrypted_text': body['encrypted_text'],
+        'signature': body['signature'],
+        'idempotency_key': body.get('idempotency_key'),
+    }
+    if not _is_valid_signature(body, body['encrypted_text'].encode()):
+        return None
+    return element
+
+def _is_valid_signature(body: dict[str, Any], data: bytes) -> bool:
+    try:
+        public_key = urlsafe_b64decode(body['public_key'])
+        Ed25519PublicKey.from_public_bytes(public_key).verify(
+            urlsafe_b64decode(body['signature']),
+            data,
+        )
+        return True
+    except (InvalidSignature, ValueError):
+        return False
+
+def _parse_limit(value: int | None) -> int | None:
+    if value is None:
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('Limit must be positive')
+    return limit
+
+def _parse_timestamp(value: str | None) -> datetime | None:
+    if value is None:
+        return None
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+def _serialise(element: dict[str, Any]) -> dict[str, Any]:
+    result = {
+        key: value
+        for key, value in element.items()
+        if key != 'recipient_public_key'
+    }
+    result['timestamp'] = element['timestamp'].isoformat()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a local stand-in for the Cryptcord API.',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    server = StandInServer(args.host, args.port, args.verbose)
+    print(f'Serving the Cryptcord API stand-in at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+
+from dataclasses import dataclass
+from queue import Queue
+from threading import Thread
+
+import httpx
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import Engine
+
+from database.notifications import outbox_notifier
+from database.operations.fernet_keys import create_fernet_keys
+from server.connection import ConnectionState
+from server.exceptions import ClientError, ServerError, UnsupportedEndpoint
+from server.operations import (
+    check_connection_async,
+    deliver_outbox_messages_async,
+    fetch_data_async,
+    long_poll_data_async,
+    post_initial_contact_keys_async,
+    post_pending_exchange_keys_async,
+)
+from server.scheduling import AdaptiveScheduler
+from server.transport import create_async_client
+from settings import settings
+
+# Delay in seconds before the receiver checks again whether to long poll.
+_RECEIVER_IDLE_DELAY = 1.0
+# Time in seconds to wait for outstanding database work when stopping.
+_STOP_TIMEOUT = 2.0
+# Errors from failed requests, after which a cycle continues.
+_REQUEST_ERRORS = (httpx.TransportError, ClientError, ServerError)
+
+_logger = logging.getLogger(__name__)
+
+@dataclass
+class SyncResult:
+    connected: bool
+    new_elements: int = 0
+    # Set if the cycle failed unexpectedly, in which case it is retried.
+    error: Exception | None = None
+
+@dataclass
+class FetchProgress:
+    stored_elements: int
+
+class SyncEngine:
+    """
+    Synchronise with the server on an event loop in a background thread.
+
+    Each cycle fetches data, posts initial and pending exchange keys and
+    delivers queued messages concurrently, with posts for many contacts made
+    in parallel up to the configured limit. Queueing a message wakes the
+    engine so that it is delivered straight away. The outcome of every cycle
+    is put on the results queue, which the Tk main loop is expected to
+    drain, preceded by progress reports while a large backlog of data is
+    fetched. The delay between cycles is chosen by an adaptive scheduler.
+
+    Whether the server can be reached is tracked by the shared connection
+    state from the outcomes of these requests. The server is only pinged
+    while it cannot be reached, or when a cycle finds the connection silent.
+
+    In the long-poll fetch mode, data is instead received by a separate task
+    that keeps a long-poll request open. If the server rejects long polling,
+    cycles fall back to fetching until the retry interval has passed.
+    """
+    def __init__(
+            self,
+            engine: Engine,
+            signature_key: Ed25519PrivateKey,
+            results: 'Queue[SyncResult | FetchProgress]',
+            connection: ConnectionState,
+        ):
+        self.engine = engine
+        self.signature_key = signature_key
+        self.results = results
+        self.connection = connection
+        self.scheduler = AdaptiveScheduler()
+        self._window_focused = False
+        self._stopping = False
+        self._long_poll_retry_time = 0.0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._main_task: asyncio.Task[None] | None = None
+        self._wake_event: asyncio.Event | None = None
+        self._fetch_lock: asyncio.Lock | None = None
+        self._thread = Thread(target=self._run_loop, daemon=True)
+
+    def start(self):
+        outbox_notifier.subscribe(None, self._wake)
+        self._thread.start()
+
+    def stop(self):
+        """Cancel any outstanding requests and wait for the thread to end."""
+        self._stopping = True
+        outbox_notifier.unsubscribe(None, self._wake)
+        if self._loop is not None and self._main_task is not None:
+            self._loop.call_soon_threadsafe(self._main_task.cancel)
+        self._thread.join(timeout=_STOP_TIMEOUT)
+
+    def set_window_focused(self, focused: bool):
+        """Record whether a message window has focus, syncing on focus."""
+        gained_focus = focused and not self._window_focused
+        self._window_focused = focused
+        if gained_focus:
+            self._wake()
+
+    def _is_long_polling(self) -> bool:
+        assert self._loop is not None
+        return (
+            settings.server.fetch_mode == 'long_poll'
+            and self._loop.time() >= self._long_poll_retry_time
+        )
+
+    def _wake(self):
+        if self._loop is not None and self._wake_event is not None:
+            self._loop.call_soon_threadsafe(self._wake_event.set)
+
+    def _report_progress(self, stored_elements: int):
+        self.results.put(FetchProgress(stored_elements))
+
+    def _run_loop(self):
+        try:
+            asyncio.run(self._run())
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        self._wake_event = asyncio.Event()
+        self._fetch_lock = asyncio.Lock()
+        semaphore = asyncio.Semaphore(settings.server.max_concurrent_posts)
+        async with create_async_client(self.connection) as http_client:
+            receiver = asyncio.create_task(self._receive(http_client))
+            while not self._stopping:
+                try:
+                    result = await self._run_cycle(http_client, semaphore)
+                except Exception as error:
+                    # Keep synchronising, as the fault may be temporary.
+                    _logger.exception('Synchronisation cycle failed')
+                    result = SyncResult(self.connection.connected, error=error)
+                self.results.put(result)
+                delay = self.scheduler.next_delay(
+                    connected=result.connected,
+                    new_elements=result.new_elements,
+                    focused=self._window_focused,
+                )
+                await self._sleep(delay)
+            receiver.cancel()
+
+    async def _fetch(self, http_client: httpx.AsyncClient) -> int:
+        assert self._fetch_lock is not None
+        async with self._fetch_lock:
+            return await fetch_data_async(
+                self.engine,
+                self.signature_key,
+                http_client,
+                self._report_progress,
+            )
+
+    async def _receive(self, http_client: httpx.AsyncClient):
+        assert self._fetch_lock is not None and self._loop is not None
+        scheduling = settings.server.scheduling
+        backoff = scheduling.burst_interval
+        while not self._stopping:
+            if not self.connection.connected or not self._is_long_polling():
+                await asyncio.sleep(_RECEIVER_IDLE_DELAY)
+                continue
+            start_time = self._loop.time()
+            try:
+                async with self._fetch_lock:
+                    new_elements = await long_poll_data_async(
+                        self.engine,
+                        self.signature_key,
+                        http_client,
+                        self._report_progress,
+                    )
+            except (UnsupportedEndpoint, ClientError, ServerError):
+                self._long_poll_retry_time = (
+                    self._loop.time()
+                    + settings.server.long_poll_retry_interval
+                )
+                continue
+            except httpx.TransportError:
+                # The connection state has recorded the failure.
+                continue
+            except Exception as error:
+                # Keep receiving, as the fault may be temporary.
+                _logger.exception('Long poll failed')
+                self.results.put(
+                    SyncResult(self.connection.connected, error=error),
+                )
+                new_elements = 0
+            if new_elements is None:
+                await asyncio.sleep(_RECEIVER_IDLE_DELAY)
+            elif new_elements:
+                backoff = scheduling.burst_interval
+                # Run a cycle straight away to process new exchange keys.
+                self.results.put(
+                    SyncResult(self.connection.connected, new_elements),
+                )
+                self._wake()
+            elif (
+                self._loop.time() - start_time
+                < settings.server.long_poll_timeout
+            ):
+                # The poll ended early without storing anything, as when an
+                # undecryptable message holds the cursor back, so wait for
+                # longer each time rather than polling again at once.
+                await asyncio.sleep(backoff)
+                backoff = min(
+                    backoff * scheduling.idle_growth,
+                    scheduling.idle_ceiling,
+                )
+            else:
+                backoff = scheduling.burst_interval
+
+    async def _run_cycle(
+            self,
+            http_client: httpx.AsyncClient,
+            semaphore: asyncio.Semaphore,
+        ) -> SyncResult:
+        new_elements = 0
+        error: Exception | None = None
+        if not self.connection.connected:
+            await check_connection_async(http_client)
+        if self.connection.connected:
+            jobs = [
+                post_initial_contact_keys_async(
+                    self.engine,
+                    self.signature_key,
+                    http_client,
+                    semaphore,
+                ),
+                post_pending_exchange_keys_async(
+                    self.engine,
+                    self.signature_key,
+                    http_client,
+                    semaphore,
+                ),
+                deliver_outbox_messages_async(
+                    self.engine,
+                    self.signature_key,
+                    http_client,
+                    semaphore,
+                ),
+            ]
+            if not self._is_long_polling():
+                jobs.append(self._fetch(http_client))
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+            for result in results:
+                if isinstance(result, int):
+                    new_elements = result
+                elif isinstance(result, _REQUEST_ERRORS):
+                    # Failed requests are retried on a later cycle, and the
+                    # connection state has recorded any transport error.
+                    continue
+                elif isinstance(result, Exception):
+                    # Let the remaining jobs complete before reporting it.
+                    _logger.error(
+                        'Synchronisation job failed',
+                        exc_info=result,
+                    )
+                    error = result
+                elif isinstance(result, BaseException):
+                    raise result
+            if self.connection.is_silent():
+                # No requests were needed, so check the server directly.
+                await check_connection_async(http_client)
+        await asyncio.to_thread(create_fernet_keys, self.engine)
+        return SyncResult(self.connection.connected, new_elements, error)
+
+    async def _sleep(self, delay: float):
+        assert self._wake_event is not None
+        try:
+            await asyncio.wait_for(self._wake_event.wait(), timeout=delay)
+        except TimeoutError:
+            pass
+        self._wake_event.clear()
@@ -0,0 +1,114 @@
+"""
+HTTP clients configured from the transport settings.
+
+Connections are pooled and kept alive within the configured limits, and
+HTTP/2 is used if enabled and the optional h2 package is installed. Compressed
+responses are decoded by httpx, and request bodies above the compression
+threshold are compressed if enabled. The outcome of every request made by
+these clients is reported to a connection state.
+"""
+import gzip
+
+from importlib.util import find_spec
+from typing import Any
+
+import httpx
+
+from pydantic import BaseModel
+
+from server.connection import ConnectionState
+from settings import settings
+
+class _ReportingTransport:
+    """Reports the outcomes of requests to a connection state."""
+    def __init__(self, state: ConnectionState):
+        self.state = state
+
+    def _finish_request(self, succeeded: bool):
+        if succeeded:
+            self.state.record_success()
+        else:
+            self.state.record_failure()
+
+class _Transport(_ReportingTransport, httpx.BaseTransport):
+    def __init__(self, state: ConnectionState):
+        self._transport = httpx.HTTPTransport(**_get_transport_options())
+        super().__init__(state)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = self._transport.handle_request(request)
+        except httpx.TransportError:
+            self._finish_request(False)
+            raise
+        self._finish_request(True)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+class _AsyncTransport(_ReportingTransport, httpx.AsyncBaseTransport):
+    def __init__(self, state: ConnectionState):
+        self._transport = httpx.AsyncHTTPTransport(**_get_transport_options())
+        super().__init__(state)
+
+    async def handle_async_request(
+            self,
+            request: httpx.Request,
+        ) -> httpx.Response:
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError:
+            self._finish_request(False)
+            raise
+        self._finish_request(True)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def create_async_client(state: ConnectionState) -> httpx.AsyncClient:
+    """Create an asynchronous client that reports to a connection state."""
+    return httpx.AsyncClient(
+        timeout=get_timeout(settings.server.request_timeout),
+        transport=_AsyncTransport(state),
+    )
+
+def create_client(state: ConnectionState) -> httpx.Client:
+    """Create a client that reports to a connection state."""
+    return httpx.Client(
+        timeout=get_timeout(settings.server.request_timeout),
+        transport=_Transport(state),
+    )
+
+def encode_request(request: BaseModel) -> tuple[bytes, dict[str, str]]:
+    """Encode a request as a JSON body, returning it with its headers."""
+    # Serialised directly, without building a dictionary first.
+    content = request.model_dump_json().encode()
+    headers = {'Content-Type': 'application/json'}
+    transport = settings.server.transport
+    if (
+        transport.compress_requests
+        and len(content) >= transport.compression_threshold
+    ):
+        content = gzip.compress(content, compresslevel=6)
+        headers['Content-Encoding'] = 'gzip'
+    return content, headers
+
+def get_timeout(read_timeout: float) -> httpx.Timeout:
+    """Return a timeout for an endpoint, with the shared connect timeout."""
+    return httpx.Timeout(
+        read_timeout,
+        connect=settings.server.transport.connect_timeout,
+    )
+
+def _get_transport_options() -> dict[str, Any]:
+    transport = settings.server.transport
+    return {
+        'http2': transport.http2 and find_spec('h2') is not None,
+        'limits': httpx.Limits(
+            max_connections=transport.max_connections,
+            max_keepalive_connections=transport.max_keepalive_connections,
+            keepalive_expiry=transport.keepalive_expiry,
+        ),
+    }
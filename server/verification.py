@@ -0,0 +1,21 @@
+from typing import Sequence
+
+from parallel import parallel_map
+from server.schemas.responses import FetchedKey, FetchedMessage
+from settings import settings
+
+type _FetchedElement = FetchedKey | FetchedMessage
+
+def verify_signatures(elements: Sequence[_FetchedElement]) -> list[bool]:
+    """
+    Verify the signatures of fetched elements across a thread pool.
+
+    Each result is cached on its element by the is_valid property, so later
+    checks made while storing the elements do not repeat the work. The pool
+    size is taken from the settings, defaulting to the number of CPUs.
+    """
+    return parallel_map(
+        lambda x: x.is_valid,
+        elements,
+        settings.functionality.verification_workers,
+    )
\ No newline at end of file
@@ -1,15 +1,29 @@
 import os
 
+from typing import Literal
+
 import yaml
 
 from pydantic import BaseModel, Field
 
+class _SQLiteSettingsModel(BaseModel):
+    journal_mode: Literal['delete', 'truncate', 'persist', 'wal'] = 'wal'
+    synchronous: Literal['off', 'normal', 'full', 'extra'] = 'normal'
+    mmap_size: int = Field(default=268_435_456, ge=0)
+    cache_size_kib: int = Field(default=65_536, ge=0)
+    busy_timeout: float = Field(default=5.0, ge=0.0)
+    foreign_keys: bool = True
+
 class _DatabaseSettingsModel(BaseModel):
     url: str = 'sqlite:///database.db'
+    sqlite: _SQLiteSettingsModel = _SQLiteSettingsModel()
 
 class _FunctionalitySettingsModel(BaseModel):
-    message_refresh_interval: float = Field(default=1.0, ge=0.001)
+    key_derivation_workers: int | None = Field(default=None, ge=1)
+    message_refresh_interval: float | None = Field(default=30.0, ge=0.001)
+    message_page_size: int = Field(default=100, ge=1)
     scroll_speed: int = Field(default=5, ge=1)
+    verification_workers: int | None = Field(default=None, ge=1)
 
 class _DialogGraphicsSettingsModel(BaseModel):
     description_wrap_length: int = Field(default=480, ge=1)
@@ -22,14 +36,45 @@ class _GraphicsSettingsModel(BaseModel):
     horizontal_padding: int = Field(default=10, ge=1)
     vertical_padding: int = Field(default=10, ge=1)
 
+class _SchedulingSettingsModel(BaseModel):
+    burst_interval: float = Field(default=1.0, ge=0.001)
+    focused_interval: float = Field(default=2.0, ge=0.001)
+    idle_growth: float = Field(default=1.5, ge=1.0)
+    idle_ceiling: float = Field(default=60.0, ge=0.001)
+    backoff_base: float = Field(default=1.0, ge=0.001)
+    backoff_ceiling: float = Field(default=60.0, ge=0.001)
+
+class _TransportSettingsModel(BaseModel):
+    max_connections: int = Field(default=16, ge=1)
+    max_keepalive_connections: int = Field(default=8, ge=0)
+    keepalive_expiry: float = Field(default=30.0, ge=0.0)
+    http2: bool = False
+    compress_requests: bool = False
+    compression_threshold: int = Field(default=1024, ge=0)
+    connect_timeout: float = Field(default=5.0, gt=0.0)
+    fetch_timeout: float = Field(default=30.0, gt=0.0)
+    post_timeout: float = Field(default=10.0, gt=0.0)
+
 class _ServerSettingsModel(BaseModel):
     post_message_url: str = 'http://127.0.0.1:8000/data/post/message'
+    post_messages_url: str = 'http://127.0.0.1:8000/data/post/messages'
     post_exchange_key_url: str = 'http://127.0.0.1:8000/data/post/exchange-key'
     fetch_data_url: str = 'http://127.0.0.1:8000/data/fetch'
+    long_poll_url: str = 'http://127.0.0.1:8000/data/fetch/wait'
     ping_url: str = 'http://127.0.0.1:8000/ping'
     ping_timeout: float = Field(default=1.0, gt=0.0)
+    ping_after: float = Field(default=60.0, gt=0.0)
     request_timeout: float = Field(default=5.0, gt=0.0)
     operations_sleep: float = Field(default=5.0, ge=0.001)
+    max_concurrent_posts: int = Field(default=8, ge=1)
+    post_batch_size: int = Field(default=100, ge=1, le=500)
+    batch_retry_interval: float = Field(default=300.0, gt=0.0)
+    fetch_mode: Literal['poll', 'long_poll'] = 'poll'
+    fetch_page_size: int = Field(default=500, ge=1)
+    long_poll_timeout: float = Field(default=30.0, gt=0.0)
+    long_poll_retry_interval: float = Field(default=300.0, gt=0.0)
+    scheduling: _SchedulingSettingsModel = _SchedulingSettingsModel()
+    transport: _TransportSettingsModel = _TransportSettingsModel()
 
 class _SettingsModel(BaseModel):
     local_database: _DatabaseSettingsModel = _DatabaseSettingsModel()
@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+# Let the tests import the application's packages from any directory.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Settings are loaded from the working directory, and written there if
+# missing, so run from an empty directory to use the defaults.
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from database.engine import create_database_engine, create_database_schema
+from database.key_rings import invalidate_key_rings
+from database.models import Contact
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Iterator[Engine]:
+    yield from _create_engine(tmp_path / 'database.db')
+
+@pytest.fixture
+def contact_engine(tmp_path: Path) -> Iterator[Engine]:
+    """The database of a contact, for tests with two users."""
+    yield from _create_engine(tmp_path / 'contact_database.db')
+
+def _create_engine(path: Path) -> Iterator[Engine]:
+    # A file rather than an in-memory database, so that the sync engine can
+    # open connections from its own threads as it does in the client.
+    engine = create_database_engine(f'sqlite:///{path}')
+    create_database_schema(engine)
+    yield engine
+    # Key rings are cached by contact id for the whole process.
+    with Session(engine) as session:
+        invalidate_key_rings(session.scalars(select(Contact.id)).all())
+    engine.dispose()
\ No newline at end of file
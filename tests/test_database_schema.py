@@ -0,0 +1,26 @@
+"""
+Check that indexes added since a database was created are created for it.
+"""
+from pathlib import Path
+
+from sqlalchemy import inspect, text
+
+from database.engine import create_database_engine, create_database_schema
+
+def test_missing_indexes_are_created(tmp_path: Path):
+    engine = create_database_engine(f'sqlite:///{tmp_path / "local.db"}')
+    create_database_schema(engine)
+    # Recreate a database from before the indexes were added.
+    with engine.begin() as connection:
+        connection.execute(text('DROP INDEX sent_keys_contact_index'))
+        connection.execute(text('DROP INDEX messages_contact_timestamp_index'))
+    create_database_schema(engine)
+    create_database_schema(engine)
+    inspector = inspect(engine)
+    assert 'sent_keys_contact_index' in {
+        x['name'] for x in inspector.get_indexes('sent_keys')
+    }
+    assert 'messages_contact_timestamp_index' in {
+        x['name'] for x in inspector.get_indexes('messages')
+    }
+    engine.dispose()
\ No newline at end of file
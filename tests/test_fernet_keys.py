@@ -0,0 +1,52 @@
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from sqlalchemy import Engine, insert, select
+from sqlalchemy.orm import Session
+
+from database.models import Contact, FernetKey, ReceivedKey, SentKey
+from database.operations.fernet_keys import create_fernet_keys
+from schema_components.validators import key_to_base64
+
+def test_low_order_keys_are_discarded(engine: Engine):
+    sent_keys = [X25519PrivateKey.generate() for _ in range(2)]
+    # Exchanging with a low-order point such as zero fails.
+    received_keys = [
+        key_to_base64(X25519PrivateKey.generate().public_key()),
+        urlsafe_b64encode(bytes(32)).decode(),
+    ]
+    with Session(engine) as session:
+        session.execute(insert(Contact), [{
+            'name': 'Contact',
+            'public_key': key_to_base64(
+                Ed25519PrivateKey.generate().public_key(),
+            ),
+        }])
+        session.execute(insert(SentKey), [
+            {
+                'private_key': key_to_base64(x),
+                'public_key': key_to_base64(x.public_key()),
+                'contact_id': 1,
+            }
+            for x in sent_keys
+        ])
+        session.execute(insert(ReceivedKey), [
+            {
+                'public_key': x,
+                'timestamp': datetime.now(timezone.utc),
+                'contact_id': 1,
+                'sent_key_id': i + 1,
+            }
+            for i, x in enumerate(received_keys)
+        ])
+        session.commit()
+    create_fernet_keys(engine)
+    with Session(engine) as session:
+        fernet_key_ids = session.scalars(select(FernetKey.id)).all()
+        received_key_rows = session.execute(
+            select(ReceivedKey.public_key, ReceivedKey.fernet_key_id),
+        ).all()
+    assert fernet_key_ids == [1]
+    assert [tuple(x) for x in received_key_rows] == [(received_keys[0], 1)]
\ No newline at end of file
@@ -0,0 +1,146 @@
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from sqlalchemy import Engine, func, insert, select
+from sqlalchemy.orm import Session
+
+from database.models import Contact, ReceivedKey, SentKey
+from database.operations.exchange_keys import add_fetched_keys
+from schema_components.validators import base64_to_raw, key_to_base64
+from server.schemas.responses import FetchDataResponse, FetchedKey
+
+_ALPHABET = (
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+)
+# Enough senders to span several key queries.
+SENDER_COUNT = 1_200
+
+def test_exchange_keys_are_canonicalised():
+    key = _create_key()
+    fetched_key = _create_fetched_key(
+        Ed25519PrivateKey.generate(),
+        _make_non_canonical(key),
+    )
+    assert fetched_key.transmitted_exchange_key == key
+
+def test_other_base64_encodings_are_accepted():
+    fetched_key = _create_fetched_key(
+        Ed25519PrivateKey.generate(),
+        _create_key(),
+    )
+    element = {
+        'sender_public_key': _to_standard_unpadded(fetched_key.sender_key),
+        'transmitted_exchange_key': _to_standard_unpadded(
+            fetched_key.transmitted_exchange_key,
+        ),
+        'signature': _to_standard_unpadded(fetched_key.signature),
+        'timestamp': fetched_key.timestamp.isoformat(),
+    }
+    response = FetchDataResponse.model_validate({
+        'status': 'success',
+        'message': 'Data fetched.',
+        'data': {'exchange_keys': [element], 'messages': []},
+    })
+    [parsed_key] = response.data.exchange_keys
+    assert parsed_key.sender_key == fetched_key.sender_key
+    assert (
+        parsed_key.transmitted_exchange_key
+        == fetched_key.transmitted_exchange_key
+    )
+    assert parsed_key.signature == fetched_key.signature
+    assert parsed_key.is_valid
+
+def test_repeated_key_with_other_encoding_is_skipped(engine: Engine):
+    sender = Ed25519PrivateKey.generate()
+    _add_contacts(engine, [sender])
+    key = _create_key()
+    assert add_fetched_keys(engine, [_create_fetched_key(sender, key)]) == 1
+    repeated_key = _create_fetched_key(sender, _make_non_canonical(key))
+    new_key = _create_fetched_key(sender, _create_key())
+    assert add_fetched_keys(engine, [repeated_key, new_key]) == 1
+    with Session(engine) as session:
+        assert session.scalar(select(func.count(ReceivedKey.id))) == 2
+
+def test_keys_are_resolved_in_chunks(engine: Engine):
+    senders = [Ed25519PrivateKey.generate() for _ in range(SENDER_COUNT)]
+    _add_contacts(engine, senders)
+    fetched_keys = [_create_fetched_key(x, _create_key()) for x in senders]
+    # A sender who is not a contact is ignored.
+    fetched_keys.append(
+        _create_fetched_key(Ed25519PrivateKey.generate(), _create_key()),
+    )
+    assert add_fetched_keys(engine, fetched_keys) == SENDER_COUNT
+    assert add_fetched_keys(engine, fetched_keys) == 0
+    with Session(engine) as session:
+        query = select(ReceivedKey.contact_id).order_by(ReceivedKey.id)
+        contact_ids = session.scalars(query).all()
+    assert contact_ids == list(range(1, SENDER_COUNT + 1))
+
+def test_responses_are_matched_to_sent_keys(engine: Engine):
+    sender = Ed25519PrivateKey.generate()
+    _add_contacts(engine, [sender])
+    sent_key = X25519PrivateKey.generate()
+    with Session(engine) as session:
+        session.execute(insert(SentKey), [{
+            'private_key': key_to_base64(sent_key),
+            'public_key': key_to_base64(sent_key.public_key()),
+            'contact_id': 1,
+        }])
+        session.commit()
+    fetched_key = _create_fetched_key(
+        sender,
+        _create_key(),
+        key_to_base64(sent_key.public_key()),
+    )
+    assert add_fetched_keys(engine, [fetched_key]) == 1
+    with Session(engine) as session:
+        assert session.scalar(select(ReceivedKey.sent_key_id)) == 1
+
+def test_forgery_cannot_claim_a_key(engine: Engine):
+    sender = Ed25519PrivateKey.generate()
+    _add_contacts(engine, [sender])
+    key = _create_key()
+    genuine = _create_fetched_key(sender, key)
+    # A key signed by someone else, but claiming to be from the sender.
+    other = Ed25519PrivateKey.generate()
+    signature = _create_fetched_key(other, key).signature
+    forgery = genuine.model_copy(update={'signature': signature})
+    assert add_fetched_keys(engine, [forgery, genuine]) == 1
+
+def _add_contacts(engine: Engine, senders: list[Ed25519PrivateKey]):
+    with Session(engine) as session:
+        session.execute(insert(Contact), [
+            {
+                'name': f'Sender {i}',
+                'public_key': key_to_base64(x.public_key()),
+            }
+            for i, x in enumerate(senders)
+        ])
+        session.commit()
+
+def _create_fetched_key(
+        sender: Ed25519PrivateKey,
+        encoded_key: str,
+        initial_key: str | None = None,
+    ) -> FetchedKey:
+    signature = sender.sign(base64_to_raw(encoded_key, 32))
+    return FetchedKey.model_validate({
+        'sender_public_key': key_to_base64(sender.public_key()),
+        'transmitted_exchange_key': encoded_key,
+        'initial_exchange_key': initial_key,
+        'signature': urlsafe_b64encode(signature).decode(),
+        'timestamp': datetime.now(timezone.utc),
+    })
+
+def _create_key() -> str:
+    return key_to_base64(X25519PrivateKey.generate().public_key())
+
+def _make_non_canonical(encoded_key: str) -> str:
+    # The last character before the padding has two unused low bits.
+    index = _ALPHABET.index(encoded_key[-2])
+    return encoded_key[:-2] + _ALPHABET[index | 1] + '='
+
+def _to_standard_unpadded(value: str) -> str:
+    return value.replace('-', '+').replace('_', '/').rstrip('=')
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone
+
+import pytest
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import Engine, func, insert, select
+from sqlalchemy.orm import Session
+
+from database.models import Contact, FernetKey, Message
+from database.operations.messages import add_fetched_messages
+from schema_components.validators import key_to_base64
+from server.schemas.responses import FetchedMessage
+
+# Enough messages to span several nonce queries.
+MESSAGE_COUNT = 1_200
+
+class _Sender:
+    def __init__(self):
+        self.signature_key = Ed25519PrivateKey.generate()
+        self.fernet_key = Fernet.generate_key()
+
+    def create_message(self, text: str, nonce: str) -> FetchedMessage:
+        encrypted_text = Fernet(self.fernet_key).encrypt(text.encode())
+        signature = self.signature_key.sign(encrypted_text)
+        return FetchedMessage.model_validate({
+            'sender_public_key': key_to_base64(
+                self.signature_key.public_key(),
+            ),
+            'encrypted_text': encrypted_text.decode(),
+            'signature': urlsafe_b64encode(signature).decode(),
+            'timestamp': datetime.now(timezone.utc),
+            'nonce': nonce,
+        })
+
+@pytest.fixture
+def sender(engine: Engine) -> _Sender:
+    sender = _Sender()
+    with Session(engine) as session:
+        session.execute(insert(Contact), [{
+            'name': 'Sender',
+            'public_key': key_to_base64(sender.signature_key.public_key()),
+        }])
+        session.execute(insert(FernetKey), [{
+            'key': sender.fernet_key.decode(),
+            'timestamp': datetime.now(timezone.utc),
+            'contact_id': 1,
+        }])
+        session.commit()
+    return sender
+
+def test_stored_nonces_are_skipped(engine: Engine, sender: _Sender):
+    messages = [
+        sender.create_message(f'Message {i}', os.urandom(16).hex())
+        for i in range(MESSAGE_COUNT)
+    ]
+    assert add_fetched_messages(engine, messages) == (MESSAGE_COUNT, [])
+    assert add_fetched_messages(engine, messages) == (0, [])
+    assert _count_messages(engine) == MESSAGE_COUNT
+
+def test_repeated_nonces_are_stored_once(engine: Engine, sender: _Sender):
+    nonce = os.urandom(16).hex()
+    messages = [sender.create_message('Message', nonce) for _ in range(3)]
+    assert add_fetched_messages(engine, messages) == (1, [])
+    assert _count_messages(engine) == 1
+
+def test_forgery_cannot_claim_a_nonce(engine: Engine, sender: _Sender):
+    nonce = os.urandom(16).hex()
+    genuine = sender.create_message('Genuine', nonce)
+    # A copy of the genuine message's signature over different text.
+    forged_text = sender.create_message('Forged', nonce).encrypted_text
+    forgery = genuine.model_copy(update={'encrypted_text': forged_text})
+    assert add_fetched_messages(engine, [forgery, genuine]) == (1, [])
+    with Session(engine) as session:
+        assert session.scalars(select(Message.text)).all() == ['Genuine']
+
+def _count_messages(engine: Engine) -> int:
+    with Session(engine) as session:
+        return session.scalar(select(func.count(Message.id))) or 0
\ No newline at end of file
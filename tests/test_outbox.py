@@ -0,0 +1,217 @@
+import json
+import os
+
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import httpx
+import pytest
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import Engine, insert, select, update
+from sqlalchemy.orm import Session
+
+from database.models import (
+    Contact,
+    FernetKey,
+    Message,
+    OutboxMessage,
+    OutboxStatus,
+)
+from database.operations.contacts import get_contacts
+from database.operations.outbox import (
+    dismiss_outbox_message,
+    record_failed_delivery,
+    retry_outbox_message,
+)
+from database.schemas.output import ContactOutputSchema
+from schema_components.validators import datetime_to_utc, key_to_base64
+from server.exceptions import ServerError
+from server import operations
+from server.operations import deliver_outbox_messages, queue_message
+from settings import settings
+
+type _Handler = Callable[[httpx.Request], httpx.Response]
+
+@pytest.fixture
+def contact(engine: Engine) -> ContactOutputSchema:
+    with Session(engine) as session:
+        session.execute(insert(Contact), [{
+            'name': 'Contact',
+            'public_key': key_to_base64(
+                Ed25519PrivateKey.generate().public_key(),
+            ),
+        }])
+        session.execute(insert(FernetKey), [{
+            'key': Fernet.generate_key().decode(),
+            'timestamp': datetime.now(timezone.utc),
+            'contact_id': 1,
+        }])
+        session.commit()
+    [contact] = get_contacts(engine)
+    return contact
+
+def test_failed_posts_are_retried_after_a_backoff(
+        engine: Engine,
+        contact: ContactOutputSchema,
+    ):
+    requests: list[httpx.Request] = list()
+    signature_key = Ed25519PrivateKey.generate()
+    queue_message(engine, signature_key, 'First', contact)
+    with _create_client(requests, lambda _: httpx.Response(503)) as client:
+        with pytest.raises(ServerError):
+            deliver_outbox_messages(engine, signature_key, client)
+        [(attempts, next_attempt)] = _get_attempts(engine)
+        assert attempts == 1
+        expected = datetime.now(timezone.utc) + timedelta(
+            seconds=settings.server.scheduling.backoff_base,
+        )
+        assert abs(next_attempt - expected) < timedelta(seconds=1)
+        # Later messages wait for the first, rather than overtaking it.
+        queue_message(engine, signature_key, 'Second', contact)
+        deliver_outbox_messages(engine, signature_key, client)
+    assert len(requests) == 1
+
+def test_backoff_is_capped(engine: Engine, contact: ContactOutputSchema):
+    queue_message(engine, Ed25519PrivateKey.generate(), 'Message', contact)
+    with Session(engine) as session:
+        session.execute(update(OutboxMessage).values(attempts=10_000))
+        session.commit()
+    record_failed_delivery(engine, 1, permanent=False)
+    [(_, next_attempt)] = _get_attempts(engine)
+    ceiling = datetime.now(timezone.utc) + timedelta(
+        seconds=settings.server.scheduling.backoff_ceiling,
+    )
+    assert next_attempt <= ceiling
+
+def test_rejected_posts_are_not_retried(
+        engine: Engine,
+        contact: ContactOutputSchema,
+    ):
+    requests: list[httpx.Request] = list()
+    signature_key = Ed25519PrivateKey.generate()
+    queue_message(engine, signature_key, 'Message', contact)
+    with _create_client(requests, lambda _: httpx.Response(400)) as client:
+        deliver_outbox_messages(engine, signature_key, client)
+        deliver_outbox_messages(engine, signature_key, client)
+    assert len(requests) == 1
+    with Session(engine) as session:
+        status = session.scalar(select(OutboxMessage.status))
+    assert status == OutboxStatus.FAILED
+
+def test_rejected_posts_can_be_retried(
+        engine: Engine,
+        contact: ContactOutputSchema,
+    ):
+    requests: list[httpx.Request] = list()
+    signature_key = Ed25519PrivateKey.generate()
+    queue_message(engine, signature_key, 'Message', contact)
+    with _create_client(requests, lambda _: httpx.Response(400)) as client:
+        deliver_outbox_messages(engine, signature_key, client)
+    retry_outbox_message(engine, 1)
+    with _create_client(requests, _accept_message) as client:
+        deliver_outbox_messages(engine, signature_key, client)
+    assert len(requests) == 2
+    with Session(engine) as session:
+        assert session.scalar(select(OutboxMessage.id)) is None
+        assert session.scalars(select(Message.text)).all() == ['Message']
+
+def test_rejected_posts_can_be_dismissed(
+        engine: Engine,
+        contact: ContactOutputSchema,
+    ):
+    signature_key = Ed25519PrivateKey.generate()
+    queue_message(engine, signature_key, 'Rejected', contact)
+    queue_message(engine, signature_key, 'Pending', contact)
+    record_failed_delivery(engine, 1, permanent=True)
+    # Only messages that failed can be dismissed.
+    dismiss_outbox_message(engine, 1)
+    dismiss_outbox_message(engine, 2)
+    with Session(engine) as session:
+        texts = session.scalars(select(OutboxMessage.text)).all()
+    assert texts == ['Pending']
+
+def test_messages_are_posted_in_batches(
+        engine: Engine,
+        contact: ContactOutputSchema,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+    monkeypatch.setattr(operations, '_batch_retry_time', 0.0)
+    requests: list[httpx.Request] = list()
+    signature_key = Ed25519PrivateKey.generate()
+    for i in range(3):
+        queue_message(engine, signature_key, f'Message {i}', contact)
+    with _create_client(requests, _accept_batch) as client:
+        deliver_outbox_messages(engine, signature_key, client)
+    assert [x.url for x in requests] == [settings.server.post_messages_url]
+    assert _get_sent_texts(engine) == [f'Message {i}' for i in range(3)]
+
+def test_unsupported_batches_are_not_retried(
+        engine: Engine,
+        contact: ContactOutputSchema,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+    monkeypatch.setattr(operations, '_batch_retry_time', 0.0)
+    requests: list[httpx.Request] = list()
+    signature_key = Ed25519PrivateKey.generate()
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url == settings.server.post_messages_url:
+            return httpx.Response(404)
+        return _accept_message(request)
+    with _create_client(requests, handler) as client:
+        for i in range(0, 4, 2):
+            queue_message(engine, signature_key, f'Message {i}', contact)
+            queue_message(engine, signature_key, f'Message {i + 1}', contact)
+            deliver_outbox_messages(engine, signature_key, client)
+    # The batch endpoint is only tried once, then messages are posted singly.
+    assert [x.url for x in requests] == [
+        settings.server.post_messages_url,
+        *[settings.server.post_message_url] * 4,
+    ]
+    assert _get_sent_texts(engine) == [f'Message {i}' for i in range(4)]
+
+def _accept_batch(request: httpx.Request) -> httpx.Response:
+    messages = json.loads(request.content)['messages']
+    return httpx.Response(200, json={
+        'status': 'success',
+        'message': 'Messages posted.',
+        'data': {
+            'results': [
+                json.loads(_accept_message(request).content)
+                for _ in messages
+            ],
+        },
+    })
+
+def _accept_message(_: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={
+        'status': 'success',
+        'message': 'Message posted.',
+        'data': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'nonce': os.urandom(16).hex(),
+        },
+    })
+
+def _create_client(
+        requests: list[httpx.Request],
+        handler: _Handler,
+    ) -> httpx.Client:
+    def record(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return handler(request)
+    return httpx.Client(transport=httpx.MockTransport(record))
+
+def _get_attempts(engine: Engine) -> list[tuple[int, datetime]]:
+    query = select(OutboxMessage.attempts, OutboxMessage.next_attempt)
+    with Session(engine) as session:
+        return [
+            (attempts, datetime_to_utc(next_attempt))
+            for attempts, next_attempt in session.execute(query)
+        ]
+
+def _get_sent_texts(engine: Engine) -> list[str]:
+    with Session(engine) as session:
+        query = select(Message.text).order_by(Message.id)
+        return list(session.scalars(query))
\ No newline at end of file
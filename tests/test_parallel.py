@@ -0,0 +1,22 @@
+from threading import get_ident
+
+from parallel import parallel_map
+
+def test_results_keep_item_order():
+    items = list(range(1_000))
+    assert parallel_map(lambda x: x * 2, items, workers=4) == [
+        x * 2 for x in items
+    ]
+
+def test_small_batches_run_on_calling_thread():
+    threads = parallel_map(lambda _: get_ident(), range(10), workers=4)
+    assert set(threads) == {get_ident()}
+
+def test_large_batches_run_across_threads():
+    threads = parallel_map(
+        lambda _: get_ident(),
+        range(1_000),
+        workers=4,
+        min_parallel=1,
+    )
+    assert get_ident() not in threads
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Check that loading contacts and their keys takes a constant number of
+statements, however many contacts are stored.
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+import httpx
+import pytest
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from sqlalchemy import Engine, event, insert
+from sqlalchemy.orm import Session
+
+from database.models import Contact, ReceivedKey, SentKey
+from database.operations.contacts import get_contacts
+from database.operations.fernet_keys import create_fernet_keys
+from schema_components.validators import key_to_base64
+from server.operations import (
+    _get_contacts_without_keys,
+    _get_pending_received_keys,
+    post_initial_contact_keys,
+)
+
+CONTACT_COUNT = 1_000
+
+@pytest.fixture
+def contacts(engine: Engine) -> Engine:
+    with Session(engine) as session:
+        session.execute(insert(Contact), [
+            {'name': f'Contact {i}', 'public_key': _create_verification_key()}
+            for i in range(CONTACT_COUNT)
+        ])
+        session.commit()
+    return engine
+
+@pytest.fixture
+def completed_exchanges(contacts: Engine) -> Engine:
+    with Session(contacts) as session:
+        private_keys = [
+            X25519PrivateKey.generate() for _ in range(CONTACT_COUNT)
+        ]
+        session.execute(insert(SentKey), [
+            {
+                'private_key': key_to_base64(x),
+                'public_key': key_to_base64(x.public_key()),
+                'contact_id': i + 1,
+            }
+            for i, x in enumerate(private_keys)
+        ])
+        session.execute(insert(ReceivedKey), _create_received_keys(True))
+        session.commit()
+    return contacts
+
+@pytest.fixture
+def pending_received_keys(contacts: Engine) -> Engine:
+    with Session(contacts) as session:
+        session.execute(insert(ReceivedKey), _create_received_keys(False))
+        session.commit()
+    return contacts
+
+def test_get_contacts(contacts: Engine):
+    result, statements = _count_statements(
+        contacts,
+        lambda: get_contacts(contacts),
+    )
+    assert len(result) == CONTACT_COUNT
+    # One for the contacts, and one for each collection loaded.
+    assert len(statements) == 3
+
+def test_get_contacts_without_keys(contacts: Engine):
+    result, statements = _count_statements(
+        contacts,
+        lambda: _get_contacts_without_keys(contacts),
+    )
+    assert len(result) == CONTACT_COUNT
+    assert len(statements) == 1
+
+def test_get_pending_received_keys(pending_received_keys: Engine):
+    result, statements = _count_statements(
+        pending_received_keys,
+        lambda: _get_pending_received_keys(pending_received_keys),
+    )
+    assert len(result) == CONTACT_COUNT
+    assert len(statements) == 4
+
+def test_post_initial_contact_keys(contacts: Engine):
+    http_client = httpx.Client(transport=httpx.MockTransport(_accept_key))
+    _, statements = _count_statements(
+        contacts,
+        lambda: post_initial_contact_keys(
+            contacts,
+            Ed25519PrivateKey.generate(),
+            http_client,
+        ),
+    )
+    # Contacts are selected once, then each sent key is inserted.
+    reads = [x for x in statements if x.lstrip().startswith('SELECT')]
+    assert len(reads) == 1
+    assert len(statements) == 1 + CONTACT_COUNT
+
+def test_create_fernet_keys(completed_exchanges: Engine):
+    _, statements = _count_statements(
+        completed_exchanges,
+        lambda: create_fernet_keys(completed_exchanges),
+    )
+    # The pending check, the selection, the insert and the update.
+    assert len(statements) == 4
+    _, statements = _count_statements(
+        completed_exchanges,
+        lambda: create_fernet_keys(completed_exchanges),
+    )
+    assert len(statements) == 1
+
+def _accept_key(_: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={
+        'status': 'success',
+        'message': 'Key posted.',
+        'data': {'timestamp': datetime.now(timezone.utc).isoformat()},
+    })
+
+def _count_statements(
+        engine: Engine,
+        function: Callable[[], Any],
+    ) -> tuple[Any, list[str]]:
+    statements: list[str] = list()
+    def record(_connection, _cursor, statement: str, *_):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = function()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return result, statements
+
+def _create_exchange_key() -> str:
+    return key_to_base64(X25519PrivateKey.generate().public_key())
+
+def _create_received_keys(completed: bool) -> list[dict[str, Any]]:
+    timestamp = datetime.now(timezone.utc)
+    return [
+        {
+            'public_key': _create_exchange_key(),
+            'timestamp': timestamp,
+            'contact_id': i + 1,
+            'sent_key_id': i + 1 if completed else None,
+        }
+        for i in range(CONTACT_COUNT)
+    ]
+
+def _create_verification_key() -> str:
+    return key_to_base64(Ed25519PrivateKey.generate().public_key())
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""
+Synchronise two users through a stand-in server.
+"""
+from queue import Empty, Queue
+from typing import Iterator
+
+import httpx
+import pytest
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from database.models import Message, MessageType
+from database.operations.contacts import (
+    add_contact,
+    get_contacts,
+    remove_contact,
+)
+from database.operations.fernet_keys import create_fernet_keys
+from database.operations.sync_cursors import get_sync_cursor
+from database.schemas.input import ContactInputSchema
+from schema_components.validators import datetime_to_utc
+from server import operations
+from server.connection import ConnectionState
+from server.exceptions import ServerError
+from server.stand_in import StandInServer
+from server.sync_engine import FetchProgress, SyncEngine, SyncResult
+from settings import settings
+
+# Time in seconds to wait for the sync engine to store data.
+_SYNC_TIMEOUT = 10.0
+_URL_SETTINGS = (
+    'post_message_url',
+    'post_messages_url',
+    'post_exchange_key_url',
+    'fetch_data_url',
+    'long_poll_url',
+    'ping_url',
+)
+
+class _User:
+    def __init__(self, engine: Engine, http_client: httpx.Client):
+        self.engine = engine
+        self.http_client = http_client
+        self.signature_key = Ed25519PrivateKey.generate()
+
+    def add_contact(self, other: '_User', name: str = 'Contact'):
+        add_contact(self.engine, ContactInputSchema.model_validate({
+            'name': name,
+            'public_key': other.signature_key.public_key(),
+        }))
+
+    def fetch(self) -> int:
+        return operations.fetch_data(
+            self.engine,
+            self.signature_key,
+            self.http_client,
+        )
+
+    def get_cursor(self):
+        return get_sync_cursor(self.engine, self.signature_key.public_key())
+
+    def get_received_texts(self) -> list[str]:
+        query = (
+            select(Message.text)
+            .where(Message.message_type == MessageType.RECEIVED)
+            .order_by(Message.timestamp)
+        )
+        with Session(self.engine) as session:
+            return list(session.scalars(query))
+
+    def send(self, text: str):
+        [contact] = get_contacts(self.engine)
+        operations.queue_message(
+            self.engine,
+            self.signature_key,
+            text,
+            contact,
+        )
+        operations.deliver_outbox_messages(
+            self.engine,
+            self.signature_key,
+            self.http_client,
+        )
+
+    def sync(self):
+        self.fetch()
+        operations.post_initial_contact_keys(
+            self.engine,
+            self.signature_key,
+            self.http_client,
+        )
+        operations.post_pending_exchange_keys(
+            self.engine,
+            self.signature_key,
+            self.http_client,
+        )
+        create_fernet_keys(self.engine)
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch) -> Iterator[StandInServer]:
+    server = StandInServer(port=0)
+    server.start()
+    for name in _URL_SETTINGS:
+        path = getattr(settings.server, name).split('127.0.0.1:8000')[1]
+        monkeypatch.setattr(settings.server, name, server.url + path)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def users(
+        server: StandInServer,
+        engine: Engine,
+        contact_engine: Engine,
+    ) -> Iterator[tuple[_User, _User]]:
+    with httpx.Client() as http_client:
+        user = _User(engine, http_client)
+        contact = _User(contact_engine, http_client)
+        user.add_contact(contact)
+        contact.add_contact(user)
+        _exchange_keys(user, contact)
+        yield user, contact
+
+def test_messages_are_received(users: tuple[_User, _User]):
+    user, contact = users
+    contact.send('First')
+    contact.send('Second')
+    assert user.fetch() == 2
+    assert user.fetch() == 0
+    assert user.get_received_texts() == ['First', 'Second']
+
+def test_backlog_is_fetched_in_pages(
+        users: tuple[_User, _User],
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+    user, contact = users
+    for i in range(5):
+        contact.send(f'Message {i}')
+    monkeypatch.setattr(settings.server, 'fetch_page_size', 2)
+    progress: list[int] = list()
+    new_elements = operations.fetch_data(
+        user.engine,
+        user.signature_key,
+        user.http_client,
+        progress.append,
+    )
+    assert new_elements == 5
+    # Pages overlap at the cursor, so more elements are processed.
+    assert len(progress) >= 2 and progress == sorted(progress)
+    assert user.get_received_texts() == [f'Message {i}' for i in range(5)]
+    [*_, last_timestamp] = _get_sent_timestamps(contact)
+    assert user.get_cursor() == last_timestamp
+
+def test_failed_page_raises(users: tuple[_User, _User]):
+    user, _ = users
+    request = operations._create_fetch_data_request(
+        user.engine,
+        user.signature_key,
+    )
+    assert request is not None
+    fetch = operations._PagedFetch(user.engine, user.signature_key, None)
+    with pytest.raises(ServerError):
+        fetch.store_page(request, httpx.Response(503))
+
+def test_long_poll_falls_back_to_fetching(
+        server: StandInServer,
+        users: tuple[_User, _User],
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+    user, contact = users
+    contact.send('Message')
+    monkeypatch.setattr(settings.server, 'fetch_mode', 'long_poll')
+    # The stand-in server answers unknown paths with 404.
+    monkeypatch.setattr(
+        settings.server,
+        'long_poll_url',
+        f'{server.url}/data/fetch/unsupported',
+    )
+    monkeypatch.setattr(settings.server, 'operations_sleep', 0.1)
+    monkeypatch.setattr(settings.server.scheduling, 'idle_ceiling', 0.1)
+    results: Queue[SyncResult | FetchProgress] = Queue()
+    sync_engine = SyncEngine(
+        user.engine,
+        user.signature_key,
+        results,
+        ConnectionState(),
+    )
+    sync_engine.start()
+    try:
+        new_elements = 0
+        while not new_elements:
+            result = results.get(timeout=_SYNC_TIMEOUT)
+            if isinstance(result, SyncResult):
+                assert result.error is None
+                new_elements = result.new_elements
+    except Empty:
+        pytest.fail('No data was fetched after long polling failed')
+    finally:
+        sync_engine.stop()
+    assert user.get_received_texts() == ['Message']
+
+def test_cursor_passes_messages_from_removed_contact(
+        users: tuple[_User, _User],
+    ):
+    user, contact = users
+    contact.send('Before')
+    user.fetch()
+    [sent_timestamp] = _get_sent_timestamps(contact)
+    # The keys for the earlier message are discarded with the contact.
+    [removed] = get_contacts(user.engine)
+    remove_contact(user.engine, removed.id)
+    user.add_contact(contact)
+    user.fetch()
+    # The message is held while the new exchange is incomplete...
+    assert user.get_cursor() == sent_timestamp
+    _exchange_keys(user, contact)
+    # ...but not once it completes without making the message readable.
+    user.fetch()
+    assert user.get_cursor() > sent_timestamp
+    contact.send('After')
+    assert user.fetch() == 1
+    assert user.get_received_texts() == ['After']
+
+def test_cursor_waits_for_contacts_added_during_fetch(
+        users: tuple[_User, _User],
+    ):
+    user, contact = users
+    contact.send('Message')
+    request = operations._create_fetch_data_request(
+        user.engine,
+        user.signature_key,
+    )
+    assert request is not None
+    raw_response = operations._post(
+        user.http_client,
+        settings.server.fetch_data_url,
+        request,
+        settings.server.transport.fetch_timeout,
+    )
+    user.add_contact(_User(user.engine, user.http_client), 'New contact')
+    fetch = operations._PagedFetch(user.engine, user.signature_key, None)
+    fetch.store_page(request, raw_response)
+    assert fetch.new_elements == 1
+    # The new contact's earlier data is fetched from the start next time.
+    assert user.get_cursor() is None
+
+def _exchange_keys(user: _User, contact: _User):
+    for _ in range(3):
+        user.sync()
+        contact.sync()
+
+def _get_sent_timestamps(user: _User):
+    query = (
+        select(Message.timestamp)
+        .where(Message.message_type == MessageType.SENT)
+    )
+    with Session(user.engine) as session:
+        return [datetime_to_utc(x) for x in session.scalars(query)]
\ No newline at end of file
@@ -0,0 +1,32 @@
+from typing import Iterator
+
+import httpx
+import pytest
+
+from server.connection import ConnectionState
+from server.stand_in import StandInServer
+from server.transport import create_client
+
+@pytest.fixture
+def server() -> Iterator[StandInServer]:
+    server = StandInServer(port=0)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_requests_are_reported(server: StandInServer):
+    state = ConnectionState()
+    with create_client(state) as http_client:
+        http_client.get(f'{server.url}/ping')
+    assert state.connected
+
+def test_failed_requests_are_reported(server: StandInServer):
+    url = f'{server.url}/ping'
+    server.shutdown()
+    server.server_close()
+    state = ConnectionState(connected=True)
+    with create_client(state) as http_client:
+        with pytest.raises(httpx.TransportError):
+            http_client.get(url)
+    assert not state.connected
\ No newline at end of file